@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Measure how synchronizing an album with its photos dir scales
+
+Creates synthetic albums of increasing size (up to 100000 photos by default)
+in a temporary directory, in which one percent of the photos in the album
+file have been deleted and one percent of the files in the photos dir are
+new. The photo files are empty and there is no cache, so that
+``Album.prepare_update`` only does the bookkeeping of the album. The
+reconciliation as HugoPhotoSwipe did it before it used indexes is timed as
+well, up to 3000 photos. The fastest of three runs is reported. Run from the
+root of the repository with:
+
+    python benchmarks/album_reconciliation.py [num_photos ...]
+
+Author: Gertjan van den Burg
+License: GPL v3.
+
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from hugophotoswipe.album import Album  # noqa: E402
+from hugophotoswipe.config import settings  # noqa: E402
+from hugophotoswipe.photo import Photo  # noqa: E402
+
+SIZES = [1000, 3000, 10000, 30000, 100000]
+
+# The quadratic reconciliation is only timed for albums up to this size
+LEGACY_MAX = 3000
+
+# Every reconciliation is timed this many times and the fastest run is
+# reported
+REPEAT = 3
+
+
+def make_photos_dir(album_dir, num_photos):
+    """Create the photos dir with the files that are on disk"""
+    photo_dir = os.path.join(album_dir, settings.photo_dir)
+    os.makedirs(photo_dir)
+    for i in range(num_photos):
+        if i % 100 == 1:
+            # deleted from disk but still in the album file
+            continue
+        open(os.path.join(photo_dir, "IMG_%06i.jpg" % i), "w").close()
+
+
+def make_album(album_dir, num_photos):
+    """Create the album as it would be loaded from the album file"""
+    photo_dir = os.path.join(album_dir, settings.photo_dir)
+    album = Album(album_dir=album_dir)
+    for i in range(num_photos):
+        if i % 100 == 2:
+            # new in the photos dir
+            continue
+        filename = "IMG_%06i.jpg" % i
+        album.photos.append(
+            Photo(
+                album_name=album.name,
+                original_path=os.path.join(photo_dir, filename),
+                name=filename,
+            )
+        )
+        digest = hashlib.sha256(filename.encode("ascii")).hexdigest()
+        album.hashes.append({"file": filename, "hash": "sha256:" + digest})
+    return album
+
+
+def legacy_reconcile(album):
+    """The reconciliation of the album before it used indexes"""
+    photo_files = [p.filename for p in album.photos]
+    photo_dir = os.path.join(album._album_dir, settings.photo_dir)
+    missing = [f for f in os.listdir(photo_dir) if f not in photo_files]
+    missing.sort()
+    for f in missing:
+        album.photos.append(
+            Photo(
+                album_name=album.name,
+                original_path=os.path.join(photo_dir, f),
+                name=f,
+            )
+        )
+    to_remove = []
+    for photo in album.photos:
+        if not os.path.exists(photo.original_path):
+            to_remove.append(photo)
+    for photo in to_remove:
+        album.photos.remove(photo)
+    for photo in album.photos:
+        photo.previous_sha256 = next(
+            (
+                str(h["hash"]).split(":")[-1]
+                for h in album.hashes
+                if h["file"] == photo.filename
+            ),
+            None,
+        )
+
+
+def time_reconcile(album_dir, num_photos, func):
+    """Fastest time of a reconciliation function on a fresh album"""
+    best = None
+    for _ in range(REPEAT):
+        album = make_album(album_dir, num_photos)
+        start = time.perf_counter()
+        func(album)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    if not len(album.photos) == num_photos - num_photos // 100:
+        raise SystemExit("Unexpected number of photos after reconciliation!")
+    return best
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or SIZES
+    logging.disable(logging.INFO)
+
+    print(
+        "%8s  %14s  %12s  %14s"
+        % ("photos", "prepare_update", "per photo", "legacy")
+    )
+    tmpdir = tempfile.mkdtemp(prefix="hps_reconcile_")
+    try:
+        for num_photos in sizes:
+            album_dir = os.path.join(tmpdir, "album_%i" % num_photos)
+            make_photos_dir(album_dir, num_photos)
+            duration = time_reconcile(
+                album_dir, num_photos, lambda album: album.prepare_update()
+            )
+            legacy = "-"
+            if num_photos <= LEGACY_MAX:
+                legacy = "%12.3f s" % time_reconcile(
+                    album_dir, num_photos, legacy_reconcile
+                )
+            print(
+                "%8i  %12.3f s  %9.2f us  %14s"
+                % (num_photos, duration, 1e6 * duration / num_photos, legacy)
+            )
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
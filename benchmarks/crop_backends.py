@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Compare the speed and the crops of the crop backends
+
+Finds the thumbnail and the cover crop of the given photos (by default those
+of the test suite) with the smartcrop.py and the numpy backend, first every
+crop on its own and then both crops of a photo, with the saliency maps
+reused as in HugoPhotoSwipe. A crop is timed including the saliency map it
+needs. The fastest of three runs is reported, with the overlap (intersection
+over union) of the crops with those that SmartCrop.py finds on its own. Run
+from the root of the repository with:
+
+    python benchmarks/crop_backends.py [photo ...]
+
+Author: Gertjan van den Burg
+License: GPL v3.
+
+"""
+
+import glob
+import os
+import sys
+import time
+
+import smartcrop
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from hugophotoswipe.saliency import MIN_SCALE  # noqa: E402
+from hugophotoswipe.saliency import NumpySaliencyMap  # noqa: E402
+from hugophotoswipe.saliency import SaliencyMap  # noqa: E402
+from hugophotoswipe.saliency import analysis_scale  # noqa: E402
+from hugophotoswipe.utils import scale_box  # noqa: E402
+
+TARGETS = [(256, 256), (600, 600)]
+
+# Every backend is timed this many times and the fastest run is reported
+REPEAT = 3
+
+
+def overlap(a, b):
+    """Intersection over union of two boxes"""
+    width = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    height = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    intersection = width * height
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return intersection / (area_a + area_b - intersection)
+
+
+def crop_smartcrop(img, targets):
+    """Crops and timings of SmartCrop.py on its own"""
+    boxes, durations = [], []
+    for width, height in targets:
+        start = time.perf_counter()
+        crop = smartcrop.SmartCrop().crop(img, width, height)["top_crop"]
+        durations.append(time.perf_counter() - start)
+        x, y = crop["x"], crop["y"]
+        boxes.append((x, y, x + crop["width"], y + crop["height"]))
+    return boxes, durations
+
+
+def crop_backend(saliency_class, img, targets):
+    """Crops and timings of a backend, with the maps reused as in Photo"""
+    maps = {}
+    boxes, durations = [], []
+    for width, height in targets:
+        start = time.perf_counter()
+        scale = analysis_scale(img.size, width, height)
+        if scale not in maps:
+            maps[scale] = saliency_class.from_image(img, scale)
+        saliency = maps[scale]
+        fit = min(img.width / width, img.height / height)
+        min_scale = min(1.0, max(1 / fit, MIN_SCALE))
+        box = saliency.crop(width, height, min_scale=min_scale)
+        durations.append(time.perf_counter() - start)
+        boxes.append(scale_box(box, saliency.size, img.size))
+    return boxes, durations
+
+
+def run(func, images, targets):
+    """Crops of all images and the fastest time of every target"""
+    best = [None] * len(targets)
+    for _ in range(REPEAT):
+        totals = [0.0] * len(targets)
+        results = []
+        for img in images:
+            boxes, durations = func(img, targets)
+            results.append(boxes)
+            totals = [t + d for t, d in zip(totals, durations)]
+        best = [t if b is None else min(b, t) for b, t in zip(best, totals)]
+    return results, best
+
+
+def main():
+    here = os.path.dirname(os.path.realpath(__file__))
+    paths = sys.argv[1:] or sorted(
+        glob.glob(os.path.join(here, "..", "tests", "data", "*", "*.jpg"))
+    )
+    images = []
+    for pth in paths:
+        with Image.open(pth) as img:
+            images.append(img.convert("RGB"))
+
+    reference, _ = run(crop_smartcrop, images, TARGETS)
+    backends = [
+        ("smartcrop.py", SaliencyMap),
+        ("numpy", NumpySaliencyMap),
+    ]
+    rows = [("%ix%i" % target, [i]) for i, target in enumerate(TARGETS)]
+    rows.append(("both", list(range(len(TARGETS)))))
+
+    print("Crops of %i photos:" % len(images))
+    print(
+        "%-8s  %-14s %8s  %6s  %8s  %8s"
+        % ("crop", "backend", "time", "speed", "min IoU", "mean IoU")
+    )
+    for label, indices in rows:
+        targets = [TARGETS[i] for i in indices]
+        timings, overlaps = {}, {}
+        for name, saliency_class in backends:
+            results, durations = run(
+                lambda img, t: crop_backend(saliency_class, img, t),
+                images,
+                targets,
+            )
+            timings[name] = sum(durations)
+            overlaps[name] = [
+                overlap(boxes[j], expected[i])
+                for boxes, expected in zip(results, reference)
+                for j, i in enumerate(indices)
+            ]
+        for name, _ in backends:
+            ious = overlaps[name]
+            print(
+                "%-8s  %-14s %6.3f s  %5.1fx  %8.3f  %8.3f"
+                % (
+                    label,
+                    name,
+                    timings[name],
+                    timings["smartcrop.py"] / timings[name],
+                    min(ious),
+                    sum(ious) / len(ious),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
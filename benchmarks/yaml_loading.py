@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Compare the speed of loading an album file with and without libyaml
+
+Writes the album file of a synthetic album with the given number of photos
+(20000 by default) and loads it with the pure Python ``yaml.safe_load`` and
+with ``load_yaml``, which uses libyaml if PyYAML was built with it. The
+fastest of three runs is reported, and both loaders are checked to give the
+same data. Run from the root of the repository with:
+
+    python benchmarks/yaml_loading.py [num_photos]
+
+Author: Gertjan van den Burg
+License: GPL v3.
+
+"""
+
+import hashlib
+import os
+import sys
+import time
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from hugophotoswipe.album import Album  # noqa: E402
+from hugophotoswipe.photo import Photo  # noqa: E402
+from hugophotoswipe.utils import load_yaml  # noqa: E402
+from hugophotoswipe.utils import yaml_loader  # noqa: E402
+
+# Every loader is timed this many times and the fastest run is reported
+REPEAT = 3
+
+
+def make_album_file(num_photos):
+    """Format the album file of an album with the given number of photos"""
+    album = Album(
+        album_dir="synthetic",
+        title="A synthetic album",
+        album_date="2021-03-20",
+        properties={"location": "Somewhere", "camera": "Some camera"},
+        copyright="Someone",
+        coverimage="IMG_00000.jpg",
+        creation_time="2021-03-20T16:41:06+00:00",
+    )
+    for i in range(num_photos):
+        filename = "IMG_%05i.jpg" % i
+        album.photos.append(
+            Photo(
+                original_path=os.path.join("synthetic", "photos", filename),
+                name="photo %i" % i,
+                alt="A photo of something" if i % 2 else None,
+                caption=(
+                    "This is the caption of photo %i, which is long enough "
+                    "to be wrapped over more than a single line in the album "
+                    "file." % i
+                ),
+            )
+        )
+        digest = hashlib.sha256(filename.encode("ascii")).hexdigest()
+        album.hashes.append(
+            {
+                "file": filename,
+                "hash": "sha256:" + digest,
+                "width": 6000,
+                "height": 4000,
+                "orientation": 1,
+                "color": "#a9a7a5",
+                "blurhash": "LKKws_~9.6_19VIX-ot9ExI:M#xH",
+            }
+        )
+    return album._format_yaml("2021-03-20T16:41:06+00:00")
+
+
+def main():
+    num_photos = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    text = make_album_file(num_photos)
+
+    loaders = [("yaml.safe_load", yaml.safe_load), ("load_yaml", load_yaml)]
+    timings = {}
+    results = {}
+    for name, func in loaders:
+        best = None
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            results[name] = func(text)
+            duration = time.perf_counter() - start
+            best = duration if best is None else min(best, duration)
+        timings[name] = best
+
+    if not results["yaml.safe_load"] == results["load_yaml"]:
+        raise SystemExit("The loaders give different data!")
+
+    base = timings["yaml.safe_load"]
+    print(
+        "Album file with %i photos (%i lines), load_yaml uses %s:"
+        % (num_photos, text.count("\n"), yaml_loader().__name__)
+    )
+    for name, _ in loaders:
+        print(
+            "%-14s %8.3f s  %5.1fx"
+            % (name, timings[name], base / timings[name])
+        )
+
+
+if __name__ == "__main__":
+    main()
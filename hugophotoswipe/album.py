@@ -10,18 +10,21 @@ License: GPL v3.
 
 """
 
+import io
 import logging
 import os
 import shutil
 
-import yaml
-
-from tqdm import tqdm
-
+from .cache import AlbumCache
 from .config import settings
 from .photo import Photo
+from .pool import render_photos
+from .utils import cached_property
+from .utils import load_yaml
 from .utils import modtime
 from .utils import question_yes_no
+from .utils import read_file
+from .utils import write_if_changed
 from .utils import yaml_field_to_file
 
 
@@ -70,6 +73,11 @@ class Album(object):
     def names_unique(self):
         return len(set([p.name for p in self.photos])) == len(self.photos)
 
+    @cached_property
+    def cache(self):
+        """The persistent cache of the album"""
+        return AlbumCache.load(self._album_dir)
+
     @property
     def markdown_file(self):
         """Path of the markdown file"""
@@ -122,9 +130,12 @@ class Album(object):
                 "[%s] Removing images directory: %s" % (self.name, output_dir)
             )
             shutil.rmtree(output_dir)
+            # the crop boxes are kept, so thumbnails are quick to recreate
+            self.cache.renditions.clear()
+            self.cache.dump()
 
     def create_markdown(self):
-        """Create the markdown file, always overwrite existing"""
+        """Create the markdown file, overwrite existing if it differs"""
         # Create the header for Hugo
         coverpath = ""
         if self.coverimage is not None:
@@ -158,58 +169,52 @@ class Album(object):
             txt.append("")
 
         txt.append("{{< /wrap >}}")
-        with open(self.markdown_file, "w") as fid:
-            fid.write("\n".join(txt))
+        if not write_if_changed(self.markdown_file, "\n".join(txt)):
+            logging.info("[%s] Markdown file is unchanged." % self.name)
+            return
         print("Written markdown file: %s" % self.markdown_file)
 
     def dump(self, modification_time=None):
-        """Save the album configuration to a YAML file"""
+        """Save the album configuration to a YAML file
+
+        The file is left untouched if only the modification time would
+        change.
+        """
         if self._album_file is None:
             raise ValueError("Album file is not defined.")
 
+        # The dimensions of the original are stored with the hash, so they
+        # don't have to be read from the image when it is unchanged
+        hashes = []
+        for photo in self.photos:
+            entry = {
+                "file": photo.filename,
+                "hash": "sha256:" + self.cache.sha256sum(photo),
+                "width": photo.width,
+                "height": photo.height,
+                "orientation": photo.orientation,
+            }
+            # as are the placeholders, so that the markdown can be created
+            # without opening the image
+            for key in ["color", "blurhash", "preview"]:
+                if getattr(photo, key) is not None:
+                    entry[key] = getattr(photo, key)
+            hashes.append(entry)
+        self.hashes = hashes
+
+        current = self._format_yaml(self.modification_time)
+        if read_file(self._album_file) == current:
+            logging.info("[%s] Album file is unchanged." % self.name)
+            return
+
         # create a backup first
         self._backup()
 
         # now overwrite the existing file
+        modification_time = modification_time or modtime()
         with open(self._album_file, "w") as fid:
-            fid.write("---\n")
-            yaml_field_to_file(fid, self.title, "title")
-            yaml_field_to_file(
-                fid, self.album_date, "album_date", force_string=True
-            )
-            yaml_field_to_file(fid, None, "properties")
-            if self.properties:
-                for name, field in sorted(self.properties.items()):
-                    yaml_field_to_file(fid, field, name, indent="  ")
-            yaml_field_to_file(fid, self.copyright, "copyright")
-            yaml_field_to_file(fid, self.coverimage, "coverimage")
-            yaml_field_to_file(
-                fid, self.creation_time, "creation_time", force_string=True
-            )
-            modification_time = modification_time or modtime()
-            yaml_field_to_file(
-                fid, modification_time, "modification_time", force_string=True
-            )
-
-            fid.write("\n")
-            fid.write("photos:")
-            for photo in self.photos:
-                fid.write("\n")
-                yaml_field_to_file(fid, photo.filename, "file", indent="- ")
-                yaml_field_to_file(fid, photo.name, "name", indent="  ")
-                yaml_field_to_file(fid, photo.alt, "alt", indent="  ")
-                yaml_field_to_file(
-                    fid, photo.clean_caption, "caption", indent="  "
-                )
-
-            fid.write("\n")
-            fid.write("hashes:")
-            for photo in self.photos:
-                fid.write("\n")
-                yaml_field_to_file(fid, photo.filename, "file", indent="- ")
-                yaml_field_to_file(
-                    fid, "sha256:" + photo.sha256sum(), "hash", indent="  "
-                )
+            fid.write(self._format_yaml(modification_time))
+        self.modification_time = modification_time
         print("Updated album file: %s" % self._album_file)
 
     @classmethod
@@ -219,7 +224,7 @@ class Album(object):
         data = {"album_dir": album_dir}
         if os.path.exists(album_file):
             with open(album_file, "r") as fid:
-                data.update(yaml.safe_load(fid))
+                data.update(load_yaml(fid))
         else:
             logging.warning("Skipping non-album directory: %s" % album_dir)
             return None
@@ -229,6 +234,7 @@ class Album(object):
             settings.output_dir, album.name, settings.cover_filename
         )
 
+        hashes = {h["file"]: h for h in album.hashes}
         all_photos = []
         for p in album.photos:
             photo_path = os.path.join(album_dir, settings.photo_dir, p["file"])
@@ -236,6 +242,7 @@ class Album(object):
                 "" if p.get("caption", None) is None else p["caption"].strip()
             )
             alt = "" if p.get("alt", None) is None else p["alt"].strip()
+            entry = hashes.get(p["file"], {})
             photo = Photo(
                 album_name=album.name,
                 original_path=photo_path,
@@ -243,6 +250,12 @@ class Album(object):
                 alt=alt,
                 caption=caption,
                 copyright=album.copyright,
+                original_image_width=entry.get("width", None),
+                original_image_height=entry.get("height", None),
+                orientation=entry.get("orientation", None),
+                color=entry.get("color", None),
+                blurhash=entry.get("blurhash", None),
+                preview=entry.get("preview", None),
             )
             all_photos.append(photo)
 
@@ -256,22 +269,45 @@ class Album(object):
             album.photos.append(photo)
         return album
 
-    def update(self, modification_time=None):
-        """Update the processed images and the markdown file"""
+    def update(self, modification_time=None, filenames=None):
+        """Update the processed images and the markdown file
+
+        See ``prepare_update`` for the meaning of ``filenames``.
+        """
+        to_process = self.prepare_update(filenames=filenames)
+        if to_process is None:
+            return
+
+        for photo in render_photos(to_process, jobs=settings.jobs):
+            logging.info(
+                "[%s] Created sizes for photo: %s" % (self.name, photo.name)
+            )
+
+        self.finish_update(modification_time=modification_time)
+
+    def prepare_update(self, filenames=None):
+        """Synchronize the album with the photos dir and find stale photos
+
+        Returns the list of photos for which the sizes need to be created, or
+        None if the album can't be processed. If ``filenames`` is given, only
+        the photos with these file names are checked, the sizes of the others
+        are known to be up to date.
+        """
         if not self.names_unique:
             logging.error(
                 "Photo names for this album aren't unique. Not processing."
             )
-            return
+            return None
 
         # Make sure the list of photos from the yaml is up to date with
         # the photos in the directory, simply add all the new photos to
-        # self.photos
-        photo_files = [p.filename for p in self.photos]
+        # self.photos. The directory is listed once and the photos are
+        # matched by file name, so that this scales to very large albums.
         photo_dir = os.path.join(self._album_dir, settings.photo_dir)
-        missing = [f for f in os.listdir(photo_dir) if f not in photo_files]
-        missing.sort()
-        for f in missing:
+        with os.scandir(photo_dir) as entries:
+            on_disk = set(entry.name for entry in entries)
+        photo_files = set(p.filename for p in self.photos)
+        for f in sorted(on_disk - photo_files):
             photo = Photo(
                 album_name=self.name,
                 original_path=os.path.join(photo_dir, f),
@@ -285,15 +321,11 @@ class Album(object):
         )
 
         # Remove the photos whose files don't exist anymore
-        to_remove = []
-        for photo in self.photos:
-            if not os.path.exists(photo.original_path):
-                to_remove.append(photo)
-        for photo in to_remove:
-            self.photos.remove(photo)
+        num_photos = len(self.photos)
+        self.photos = [p for p in self.photos if p.filename in on_disk]
         logging.info(
             "[%s] Removed %i photos that have been deleted."
-            % (self.name, len(to_remove))
+            % (self.name, num_photos - len(self.photos))
         )
 
         # set the coverpath to the photo that should be the cover image
@@ -303,26 +335,38 @@ class Album(object):
             else:
                 photo.cover_path = None
 
-        # Iterate over all photos and create new resizes if they don't
-        # exist yet, or the hash in self.hashes is different than the hash of
-        # the current file on disk.
+        # Iterate over all photos and create new resizes if they aren't in
+        # the rendition manifest yet, or if the hash of the current file on
+        # disk or the settings differ from those in the manifest. The files
+        # in the output dirs are listed once, instead of checking every size
+        # of every photo on disk.
+        existing = self._list_output_files()
         photo_hashes = {}
-        for photo in self.photos:
-            hsh = next(
-                (
-                    str(h["hash"]).split(":")[-1]
-                    for h in self.hashes
-                    if h["file"] == photo.filename
-                ),
-                None,
-            )
-            photo_hashes[photo] = hsh
-
+        for h in self.hashes:
+            photo_hashes.setdefault(h["file"], str(h["hash"]).split(":")[-1])
+        if filenames is not None:
+            filenames = set(filenames)
+
+        # Photos whose file has changed since the checksum was cached are
+        # processed as well. They are then hashed and decoded from a single
+        # read of the file, and only the stale sizes are created.
         to_process = []
         for photo in self.photos:
-            if not photo.has_sizes():
-                to_process.append(photo)
-            elif not photo.sha256sum() == photo_hashes[photo]:
+            photo.previous_sha256 = photo_hashes.get(photo.filename)
+            photo.renditions = dict(
+                self.cache.renditions.get(photo.filename, {})
+            )
+            photo.crops = dict(self.cache.crops.get(photo.filename, {}))
+            if photo.cover_path is None:
+                photo.forget_cover()
+            if filenames is not None and photo.filename not in filenames:
+                continue
+            cached = self.cache.cached_sha256(photo)
+            if (
+                cached is None
+                or photo.stale_sizes(cached, existing=existing)
+                or photo.missing_placeholder()
+            ):
                 to_process.append(photo)
             photo.free()
 
@@ -330,16 +374,10 @@ class Album(object):
             "[%s] There are %i photos to process."
             % (self.name, len(to_process))
         )
-        if to_process:
-            iterator = (
-                iter(to_process)
-                if not settings.verbose
-                else tqdm(to_process, desc="Progress")
-            )
-            for photo in iterator:
-                photo.create_sizes()
-                photo.free()
+        return to_process
 
+    def finish_update(self, modification_time=None):
+        """Write the markdown file and album yaml after processing photos"""
         # Overwrite the markdown file
         logging.info("[%s] Writing markdown file." % self.name)
         self.create_markdown()
@@ -348,12 +386,90 @@ class Album(object):
         logging.info("[%s] Saving album yaml." % self.name)
         self.dump(modification_time=modification_time)
 
+        # Save the cache for the next update
+        for photo in self.photos:
+            self.cache.renditions[photo.filename] = photo.renditions
+            self.cache.crops[photo.filename] = photo.crops
+        self.cache.prune([p.filename for p in self.photos])
+        self.cache.dump()
+
     ####################
     #                  #
     # Internal methods #
     #                  #
     ####################
 
+    def _list_output_files(self):
+        """Create the output dirs of the album and list the files in them
+
+        Returns the set of paths of the files, joined as the paths of the
+        sizes of the photos are.
+        """
+        album_out = os.path.join(settings.output_dir, self.name)
+        modes = ["large", "small", "thumb"]
+        if settings.dim_ladder:
+            modes.append("ladder")
+        output_dirs = [album_out] + [
+            os.path.join(album_out, getattr(settings, "dirname_" + mode))
+            for mode in modes
+        ]
+        existing = set()
+        for output_dir in output_dirs:
+            os.makedirs(output_dir, exist_ok=True)
+            with os.scandir(output_dir) as entries:
+                existing.update(
+                    os.path.join(output_dir, e.name) for e in entries
+                )
+        return existing
+
+    def _format_yaml(self, modification_time):
+        """Format the album configuration as YAML"""
+        fid = io.StringIO()
+        fid.write("---\n")
+        yaml_field_to_file(fid, self.title, "title")
+        yaml_field_to_file(
+            fid, self.album_date, "album_date", force_string=True
+        )
+        yaml_field_to_file(fid, None, "properties")
+        if self.properties:
+            for name, field in sorted(self.properties.items()):
+                yaml_field_to_file(fid, field, name, indent="  ")
+        yaml_field_to_file(fid, self.copyright, "copyright")
+        yaml_field_to_file(fid, self.coverimage, "coverimage")
+        yaml_field_to_file(
+            fid, self.creation_time, "creation_time", force_string=True
+        )
+        yaml_field_to_file(
+            fid, modification_time, "modification_time", force_string=True
+        )
+
+        fid.write("\n")
+        fid.write("photos:")
+        for photo in self.photos:
+            fid.write("\n")
+            yaml_field_to_file(fid, photo.filename, "file", indent="- ")
+            yaml_field_to_file(fid, photo.name, "name", indent="  ")
+            yaml_field_to_file(fid, photo.alt, "alt", indent="  ")
+            yaml_field_to_file(
+                fid, photo.clean_caption, "caption", indent="  "
+            )
+
+        fid.write("\n")
+        fid.write("hashes:")
+        for entry in self.hashes:
+            fid.write("\n")
+            for key, value in entry.items():
+                indent = "- " if key == "file" else "  "
+                # the colour starts with a hash, which YAML reads as comment
+                yaml_field_to_file(
+                    fid,
+                    value,
+                    key,
+                    indent=indent,
+                    force_string=key in ["color", "blurhash", "preview"],
+                )
+        return fid.getvalue()
+
     def _backup(self):
         """Create a backup of the album file if it exists"""
         if not os.path.exists(self._album_file):
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+"""Persistent cache for album processing
+
+The AlbumCache class stores information about the photos of an album that is
+expensive to compute, such as the checksums of the original photos, the
+manifest of the resized images that have been created, and the crop boxes of
+the thumbnails. The cache is stored as a JSON file in the album directory. It
+is only used to avoid work, so it can be removed at any time.
+
+Author: Gertjan van den Burg
+License: GPL v3.
+
+"""
+
+import json
+import logging
+import os
+
+from .config import settings
+from .utils import stat_signature
+
+
+class AlbumCache(object):
+    def __init__(
+        self, cache_file=None, hashes=None, renditions=None, crops=None
+    ):
+        self._cache_file = cache_file
+        self.hashes = {} if hashes is None else hashes
+        self.renditions = {} if renditions is None else renditions
+        self.crops = {} if crops is None else crops
+
+    @classmethod
+    def load(cls, album_dir):
+        """Load the cache of an album, or create an empty one"""
+        cache_file = os.path.join(album_dir, settings.cache_file)
+        data = {}
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, "r") as fp:
+                    data = json.load(fp)
+            except ValueError:
+                logging.warning("Ignoring corrupt cache file: %s" % cache_file)
+                data = {}
+        return cls(
+            cache_file=cache_file,
+            hashes=data.get("hashes"),
+            renditions=data.get("renditions"),
+            crops=data.get("crops"),
+        )
+
+    def dump(self):
+        """Save the cache to the cache file"""
+        if self._cache_file is None:
+            raise ValueError("Cache file is not defined.")
+        data = {
+            "hashes": self.hashes,
+            "renditions": self.renditions,
+            "crops": self.crops,
+        }
+        tmp_file = self._cache_file + ".tmp"
+        with open(tmp_file, "w") as fp:
+            json.dump(data, fp, sort_keys=True)
+        os.replace(tmp_file, self._cache_file)
+
+    def prune(self, filenames):
+        """Remove the entries of photos that are no longer in the album"""
+        keep = set(filenames)
+        for section in [self.hashes, self.renditions, self.crops]:
+            for filename in list(section):
+                if filename not in keep:
+                    del section[filename]
+
+    def cached_sha256(self, photo):
+        """Get the stored checksum of a photo if the file is unchanged
+
+        Returns None if the size, modification time, or inode of the file
+        differ from when the checksum was stored, or when the
+        ``verify_hashes`` setting is enabled.
+        """
+        if settings.verify_hashes:
+            return None
+        entry = self.hashes.get(photo.filename)
+        if entry is None:
+            return None
+        if entry["stat"] != stat_signature(photo.original_path):
+            return None
+        return entry["sha256"]
+
+    def sha256sum(self, photo):
+        """Get the checksum of a photo, only reading it if it has changed
+
+        The photo is not decoded after this, so its file isn't kept mapped.
+        """
+        digest = self.cached_sha256(photo)
+        if digest is not None:
+            return digest
+
+        signature = stat_signature(photo.original_path)
+        digest = photo.sha256sum(keep_mapping=False)
+        self.hashes[photo.filename] = {"stat": signature, "sha256": digest}
+        return digest
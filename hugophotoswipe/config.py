@@ -3,8 +3,9 @@
 """Handle settings for HugoPhotoSwipe
 
 HugoPhotoSwipe uses a settings file for the configuration set by the user. This
-configuration is loaded/initialized here as a ``settings`` object and is used
-throughout the program.
+configuration is kept in the ``settings`` object that is used throughout the
+program. It holds the defaults until the settings file is loaded with
+``load_settings``, which the command line interface does.
 
 Flags to the ``hps`` executable are saved as settings as well, but are not
 dumped to the yaml file because they are runtime options.
@@ -16,16 +17,12 @@ License: GPL v3.
 
 import logging
 import os
-import warnings
-
-import yaml
+import re
 
 from . import __version__
+from .utils import load_yaml
 from .utils import yaml_field_to_file
 
-# Always show deprecationwarnings
-warnings.simplefilter("always", DeprecationWarning)
-
 # HugoPhotoSwipe version
 VERSION = __version__
 
@@ -37,26 +34,42 @@ DEFAULTS = {
     "output_dir": None,
     "url_prefix": None,
     "output_format": "jpg",
+    "extra_formats": [],
     "dirname_large": "large",
     "dirname_small": "small",
     "dirname_thumb": "thumb",
+    "dirname_ladder": "srcset",
     "dim_max_large": "1600",
     "dim_max_small": "800",
     "dim_max_thumb": "256x256",
     "dim_max_cover": "600x600",
+    "dim_ladder": [],
     "cover_filename": "coverimage.jpg",
     "photo_dir": "photos",
     "album_file": "album.yml",
+    "cache_file": ".hps_cache.json",
+    "crop_backend": "smartcrop.py",
     "use_smartcrop_js": False,
     "smartcrop_js_path": None,
+    "crop_analysis_size": None,
+    "placeholder": None,
     "jpeg_progressive": False,
     "jpeg_optimize": False,
     "jpeg_quality": 75,
+    "cascade_sizes": False,
+    "jpeg_draft": False,
     "fast": False,
+    "jobs": 1,
+    "verify_hashes": False,
+    "poll": False,
     "verbose": False,
 }
 
-DONT_DUMP = ["verbose", "fast"]
+DONT_DUMP = ["verbose", "fast", "jobs", "verify_hashes", "poll"]
+
+CROP_BACKENDS = ["smartcrop.py", "smartcrop.js", "numpy"]
+
+PLACEHOLDERS = ["blurhash", "preview"]
 
 
 class Settings(object):
@@ -68,6 +81,23 @@ class Settings(object):
             if key.startswith("dim_max_"):
                 entries[key] = str(entries[key]).strip()
 
+        # ensure dim_ladder is always a list of widths
+        ladder = entries.get("dim_ladder", None)
+        if ladder is None:
+            entries["dim_ladder"] = []
+        elif isinstance(ladder, (str, int)):
+            ladder = re.split(r"[\s,/]+", str(ladder).strip())
+            entries["dim_ladder"] = [int(w) for w in ladder if w]
+        else:
+            entries["dim_ladder"] = [int(w) for w in ladder]
+
+        # ensure extra_formats is always a list
+        formats = entries.get("extra_formats", None)
+        if formats is None:
+            entries["extra_formats"] = []
+        elif isinstance(formats, str):
+            entries["extra_formats"] = [formats]
+
         self.__dict__.update(entries)
 
     def dump(self, dirname=None, settings_filename=None):
@@ -91,18 +121,58 @@ class Settings(object):
         if self.output_dir is None:
             logging.error(prefix + "output_dir can't be empty")
             return False
-        if self.use_smartcrop_js and self.smartcrop_js_path is None:
+        if self.crop_backend not in CROP_BACKENDS:
+            logging.error(
+                prefix
+                + "unknown crop_backend: %s (choose from %s)"
+                % (self.crop_backend, ", ".join(CROP_BACKENDS))
+            )
+            return False
+        use_js = self.use_smartcrop_js or self.crop_backend == "smartcrop.js"
+        if use_js and self.smartcrop_js_path is None:
             logging.error(prefix + "smartcrop.js requested but path not set")
             return False
+        if not (self.placeholder is None or self.placeholder in PLACEHOLDERS):
+            logging.error(
+                prefix
+                + "unknown placeholder: %s (choose from %s)"
+                % (self.placeholder, ", ".join(PLACEHOLDERS))
+            )
+            return False
+        for fmt in self.extra_formats:
+            if not can_save(fmt):
+                logging.error(
+                    prefix + "extra format %s can't be saved by Pillow" % fmt
+                )
+                return False
         return True
 
 
+def can_save(fmt):
+    """Check if Pillow can save images with the extension of a format
+
+    Which formats are available depends on how Pillow is built, AVIF for
+    instance is only supported from Pillow 11.2 when it is built with
+    libavif.
+    """
+    from PIL import Image
+
+    name = Image.registered_extensions().get("." + str(fmt).lower())
+    return name is not None and name in Image.SAVE
+
+
 def load_settings(settings_filename=SETTINGS_FILENAME):
+    """Load the settings file into the shared settings object
+
+    Settings that are not in the file, and the runtime options, are reset to
+    their defaults. Returns the settings object.
+    """
     data = {}
     if os.path.exists(settings_filename):
         with open(settings_filename, "r") as fp:
-            data = yaml.safe_load(fp)
-    return Settings(**data)
+            data = load_yaml(fp)
+    settings.__init__(**data)
+    return settings
 
 
-settings = load_settings()
+settings = Settings()
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+
+"""Run commands in a long-running HugoPhotoSwipe process
+
+Starting Python and importing the image libraries takes longer than updating
+an album in which a single photo has changed. The Daemon class keeps a
+process running that listens on a Unix domain socket in the site directory,
+and keeps the settings, a pool of worker processes, and the albums it has
+loaded in memory. The ``hps update``, ``hps clean``, ``hps status``, and
+``hps stop`` commands send their command to the daemon if it is running, and
+the first two run it themselves otherwise.
+
+The client and the daemon exchange JSON messages, one per line. The client
+sends the command, after which the daemon sends the output of the command,
+and the questions it asks, until it sends the exit code. Albums that are
+changed by another process are loaded again.
+
+Author: Gertjan van den Burg
+License: GPL v3.
+
+"""
+
+import builtins
+import contextlib
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+from datetime import timedelta
+
+from .album import Album
+from .config import SETTINGS_FILENAME
+from .config import load_settings
+from .config import settings
+from .hugophotoswipe import HugoPhotoSwipe
+from .pool import close_pool
+from .pool import start_pool
+from .utils import stat_signature
+
+# Name of the socket of the daemon in the site directory
+SOCKET_FILENAME = ".hps.sock"
+
+COMMANDS = ["update", "clean", "status", "stop"]
+
+
+class Daemon(object):
+    def __init__(self, socket_path=SOCKET_FILENAME):
+        self.socket_path = socket_path
+        self.started = time.time()
+        self.requests = 0
+        self.running = False
+
+        # runtime options of the daemon, restored when settings are reloaded
+        self._runtime = {"jobs": settings.jobs, "verbose": settings.verbose}
+        self._settings_signature = self._signature(SETTINGS_FILENAME)
+
+        # loaded albums and the signatures of their album and cache files
+        self._albums = {}
+
+    def serve(self):
+        """Handle commands until the daemon is stopped"""
+        if request("status", quiet=True, socket_path=self.socket_path) == 0:
+            print("A daemon is already running in this directory.")
+            raise SystemExit(1)
+        if os.path.exists(self.socket_path):
+            # left behind by a daemon that didn't stop cleanly
+            os.unlink(self.socket_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        server.listen()
+        signal.signal(signal.SIGTERM, _terminate)
+        start_pool(settings.jobs)
+        print("Daemon listening on %s" % self.socket_path)
+        self.running = True
+        try:
+            while self.running:
+                conn, _ = server.accept()
+                with conn:
+                    self.handle(conn)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            print("Stopping daemon.")
+            server.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            close_pool()
+
+    def handle(self, conn):
+        """Run the command sent over a connection"""
+        fp = conn.makefile("rw", encoding="utf-8", newline="\n")
+        client = Client(fp)
+        try:
+            message = json.loads(fp.readline())
+        except ValueError:
+            return client.exit(1)
+        self.requests += 1
+
+        command = message.get("command")
+        logging.info("Running command from client: %s" % command)
+        code = 0
+        with contextlib.redirect_stdout(client), client.console():
+            try:
+                self.run(command, message.get("album"), message)
+            except SystemExit as err:
+                code = 0 if err.code is None else err.code
+            except Exception:
+                logging.error("Command %s failed." % command)
+                print(traceback.format_exc(), end="")
+                code = 1
+        client.exit(code)
+
+    def run(self, command, name, options):
+        """Run a command as the ``hps`` executable would"""
+        if command == "status":
+            return self.status()
+        if command == "stop":
+            self.running = False
+            print("Daemon stopped.")
+            return
+        if command not in COMMANDS:
+            print("Unknown command: %s" % command)
+            raise SystemExit(1)
+
+        self._refresh_settings()
+        settings.fast = options.get("fast", False)
+        settings.verify_hashes = options.get("verify_hashes", False)
+        if not settings.validate():
+            raise SystemExit(1)
+
+        hps = self._hps(name)
+        try:
+            if command == "update":
+                hps.update(name=name)
+            else:
+                hps.clean(name=name)
+        finally:
+            # the files written by the command are not changes by others
+            for album in hps.albums:
+                signature = self._album_signature(album.name)
+                self._albums[album.name] = (album, signature)
+
+    def status(self):
+        uptime = timedelta(seconds=int(time.time() - self.started))
+        print(
+            "HugoPhotoSwipe daemon (pid %i) in %s" % (os.getpid(), os.getcwd())
+        )
+        print("Running for %s, handled %i requests" % (uptime, self.requests))
+        print("Worker processes: %i" % settings.jobs)
+        names = ", ".join(sorted(self._albums))
+        print("Loaded albums: %i (%s)" % (len(self._albums), names))
+
+    def _hps(self, name):
+        """HugoPhotoSwipe instance with the loaded albums that are needed"""
+        album_dirs = HugoPhotoSwipe()._album_dirs
+        for album_dir in list(self._albums):
+            if album_dir not in album_dirs:
+                del self._albums[album_dir]
+        if name is not None:
+            name = name.strip("/")
+            album_dirs = [d for d in album_dirs if d == name]
+
+        albums = []
+        for album_dir in album_dirs:
+            album = self._album(album_dir)
+            if album is not None:
+                albums.append(album)
+        return HugoPhotoSwipe(albums=albums)
+
+    def _album(self, album_dir):
+        """Get a loaded album, loading it again if it changed on disk"""
+        signature = self._album_signature(album_dir)
+        album, loaded = self._albums.get(album_dir, (None, None))
+        if album is None or not loaded == signature:
+            logging.info("Loading album from dir: %s" % album_dir)
+            album = Album.load(album_dir)
+            if album is None:
+                self._albums.pop(album_dir, None)
+                return None
+            self._albums[album_dir] = (album, signature)
+        return album
+
+    def _album_signature(self, album_dir):
+        return [
+            self._signature(os.path.join(album_dir, settings.album_file)),
+            self._signature(os.path.join(album_dir, settings.cache_file)),
+        ]
+
+    def _refresh_settings(self):
+        """Load the settings file again if it has changed"""
+        signature = self._signature(SETTINGS_FILENAME)
+        if signature == self._settings_signature:
+            return
+        logging.info("Reloading settings file.")
+        load_settings()
+        settings.__dict__.update(self._runtime)
+        self._settings_signature = signature
+        self._albums = {}
+
+    @staticmethod
+    def _signature(path):
+        return stat_signature(path) if os.path.exists(path) else None
+
+
+class Client(object):
+    """The connection to a client, used as stdout while running a command"""
+
+    def __init__(self, fp):
+        self._fp = fp
+        self._connected = True
+
+    def write(self, text):
+        if text:
+            self._send({"output": text})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def input(self, prompt=""):
+        """Ask the client for a line of input"""
+        self._send({"input": prompt})
+        line = self._fp.readline() if self._connected else ""
+        if not line:
+            raise EOFError("The client disconnected.")
+        answer = json.loads(line).get("answer")
+        if answer is None:
+            raise EOFError("The client has no input.")
+        return answer
+
+    @contextlib.contextmanager
+    def console(self):
+        """Ask the client instead of the terminal of the daemon for input"""
+        original = builtins.input
+        builtins.input = self.input
+        try:
+            yield self
+        finally:
+            builtins.input = original
+
+    def exit(self, code):
+        self._send({"exit": code})
+
+    def _send(self, message):
+        if not self._connected:
+            return
+        try:
+            self._fp.write(json.dumps(message) + "\n")
+            self._fp.flush()
+        except OSError:
+            # the command is completed without the client
+            self._connected = False
+
+
+def request(command, album=None, quiet=False, socket_path=SOCKET_FILENAME):
+    """Run a command in the daemon
+
+    Returns the exit code of the command, or None if no daemon is running.
+    The output of the command is printed, unless ``quiet`` is True.
+    """
+    if not os.path.exists(socket_path):
+        return None
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        conn.close()
+        return None
+
+    message = {
+        "command": command,
+        "album": album,
+        "fast": settings.fast,
+        "verify_hashes": settings.verify_hashes,
+    }
+    with conn, conn.makefile("rw", encoding="utf-8", newline="\n") as fp:
+        fp.write(json.dumps(message) + "\n")
+        fp.flush()
+        for line in fp:
+            message = json.loads(line)
+            if "output" in message:
+                if not quiet:
+                    sys.stdout.write(message["output"])
+                    sys.stdout.flush()
+            elif "input" in message:
+                try:
+                    answer = input(message["input"])
+                except EOFError:
+                    answer = None
+                fp.write(json.dumps({"answer": answer}) + "\n")
+                fp.flush()
+            elif "exit" in message:
+                return message["exit"]
+    print("Lost the connection to the daemon.")
+    return 1
+
+
+def _terminate(signum, frame):
+    raise KeyboardInterrupt
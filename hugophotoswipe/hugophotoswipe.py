@@ -4,7 +4,7 @@
 
 This file contains the HugoPhotoSwipe class which is handles the command line
 user interface commands through several methods. It handles creation of new
-albums, updating albums, and cleaning albums.
+albums, updating albums, cleaning albums, and watching albums for changes.
 
 Author: Gertjan van den Burg
 License: GPL v3.
@@ -16,12 +16,33 @@ import os
 
 from .album import Album
 from .config import settings
+from .pool import render_photos
 from .utils import modtime
 
 
 class HugoPhotoSwipe(object):
     def __init__(self, albums=None):
-        self._albums = self._load_albums() if albums is None else albums
+        # Albums are only loaded when they are needed, so that a command for
+        # a single album doesn't have to read the files of all the others.
+        self._albums = albums
+        self._album_dirs = self._find_album_dirs() if albums is None else []
+
+    ##############
+    #            #
+    # Properties #
+    #            #
+    ##############
+
+    @property
+    def albums(self):
+        """Iterate over all albums, loading each when it is reached"""
+        if self._albums is not None:
+            yield from self._albums
+            return
+        for album_dir in self._album_dirs:
+            album = self._load_album(album_dir)
+            if album is not None:
+                yield album
 
     ################
     #              #
@@ -55,14 +76,35 @@ class HugoPhotoSwipe(object):
         self.update_all() if name is None else self.update_single(name)
 
     def update_all(self):
-        for album in self._albums:
+        # Collect the stale photos of all albums in a single queue, so that
+        # the worker processes don't sit idle at the end of each album.
+        to_process = []
+        album_of = {}
+        remaining = {}
+        for album in self.albums:
             print("Updating album: %s" % album.name)
-            album.update()
+            photos = album.prepare_update()
+            if photos is None:
+                continue
+            if not photos:
+                album.finish_update()
+                continue
+            for photo in photos:
+                album_of[id(photo)] = album
+            remaining[album.name] = len(photos)
+            to_process.extend(photos)
+
+        # Finish each album as soon as its last photo is done
+        for photo in render_photos(to_process, jobs=settings.jobs):
+            album = album_of[id(photo)]
+            remaining[album.name] -= 1
+            if remaining[album.name] == 0:
+                album.finish_update()
         print("All albums updated.")
 
     def update_single(self, name):
         name = name.strip("/")
-        album = next((a for a in self._albums if a.name == name), None)
+        album = self._get_album(name)
         if album is None:
             print("Couldn't find album with name %s. Stopping." % name)
             raise SystemExit(1)
@@ -74,35 +116,65 @@ class HugoPhotoSwipe(object):
         self.clean_all() if name is None else self.clean_single(name)
 
     def clean_all(self):
-        for album in self._albums:
+        for album in self.albums:
             album.clean()
         print("All albums cleaned.")
 
     def clean_single(self, name):
         name = name.strip("/")
-        album = next((a for a in self._albums if a.name == name), None)
+        album = self._get_album(name)
         if album is None:
             print("Couldn't find album with name %s. Stopping." % name)
             raise SystemExit(1)
         album.clean()
         print("Album %s cleaned." % album.name)
 
+    def watch(self, name=None):
+        """Update the albums, or a single album, whenever they change"""
+        from .watch import AlbumWatcher
+        from .watch import get_monitor
+
+        if name is not None:
+            name = name.strip("/")
+            if self._get_album(name) is None:
+                print("Couldn't find album with name %s. Stopping." % name)
+                raise SystemExit(1)
+        monitor = get_monitor(poll=settings.poll)
+        AlbumWatcher(self, monitor, name=name).run()
+
     ####################
     #                  #
     # Internal methods #
     #                  #
     ####################
 
-    def _load_albums(self):
-        """Load all albums from the current directory"""
-        local_objects = os.listdir(".")
-        local_dirs = [o for o in local_objects if os.path.isdir(o)]
-        album_dirs = [d.lstrip("./") for d in local_dirs]
-        albums = []
-        for album_dir in album_dirs:
-            logging.info("Loading album from dir: %s" % album_dir)
-            album = Album.load(album_dir)
-            if album is None:
+    def _find_album_dirs(self):
+        """Find the album directories in the current directory
+
+        Only the presence of the album file is checked, the albums are
+        loaded by ``_load_album`` when they are needed.
+        """
+        album_dirs = []
+        for entry in sorted(os.scandir("."), key=lambda e: e.name):
+            if not entry.is_dir():
+                continue
+            album_file = os.path.join(entry.name, settings.album_file)
+            if not os.path.exists(album_file):
+                logging.warning(
+                    "Skipping non-album directory: %s" % entry.name
+                )
                 continue
-            albums.append(album)
-        return albums
+            album_dirs.append(entry.name)
+        return album_dirs
+
+    def _get_album(self, name):
+        """Get the album with the given name, or None if it doesn't exist"""
+        if self._albums is not None:
+            return next((a for a in self._albums if a.name == name), None)
+        if name not in self._album_dirs:
+            return None
+        return self._load_album(name)
+
+    def _load_album(self, album_dir):
+        logging.info("Loading album from dir: %s" % album_dir)
+        return Album.load(album_dir)
@@ -5,6 +5,9 @@
 The Photo class contains the methods to rescale individual images and to
 generate the shortcode for the image for the Markdown file.
 
+The image libraries are imported when they are first needed, so that
+albums in which nothing has changed are updated without loading them.
+
 
 Author: Gertjan van den Burg
 License: GPL v3.
@@ -12,22 +15,25 @@ License: GPL v3.
 """
 
 import hashlib
+import json
 import logging
+import math
+import mmap
 import os
-import tempfile
 
 from functools import total_ordering
-from subprocess import check_output
 from textwrap import indent
 from textwrap import wrap
 
-import smartcrop
-
-from PIL import ExifTags
-from PIL import Image
-
 from .config import settings
 from .utils import cached_property
+from .utils import scale_box
+from .utils import stat_signature
+
+# Thumbnails are only cropped from a reduced image (an intermediate size or a
+# draft decode) if the largest crop that fits is this much larger than the
+# thumbnail, because SmartCrop can choose a crop that is smaller than that.
+CROP_MARGIN = 1.25
 
 
 @total_ordering
@@ -40,14 +46,21 @@ class Photo(object):
         alt=None,
         caption=None,
         copyright=None,
+        original_image_width=None,
+        original_image_height=None,
+        orientation=None,
+        color=None,
+        blurhash=None,
+        preview=None,
     ):
         # album
         self.album_name = album_name
 
         # original image properties
         self.original_path = original_path
-        self.original_image_width = None
-        self.original_image_height = None
+        self.original_image_width = original_image_width
+        self.original_image_height = original_image_height
+        self.orientation = orientation
 
         # names
         self.name = name
@@ -58,8 +71,24 @@ class Photo(object):
         self.copyright = copyright
         self.cover_path = None
 
+        # placeholders, stored in the album file so that the markdown can be
+        # created without opening the original
+        self.color = color
+        self.blurhash = blurhash
+        self.preview = preview
+
+        # checksum of the original in the album file, the manifest of the
+        # sizes that have been created, and the crop boxes of the thumbnails
+        self.previous_sha256 = None
+        self.renditions = {}
+        self.crops = {}
+
         # caching
         self._original_img = None
+        self._original_data = None
+        self._original_signature = None
+        self._sha256 = None
+        self._saliency = None
 
     ################
     #              #
@@ -78,11 +107,45 @@ class Photo(object):
         return self._original_img
 
     def _load_original_image(self):
-        img = Image.open(self.original_path)
-        # if there is no exif data, simply return the image
-        exif = img._getexif()
+        from PIL import Image
+
+        data = self._map_original()
+        img = Image.open(self.original_path if data is None else data)
+        orientation = self._exif_orientation(img)
+
+        # dimensions of the full image as it will be shown
+        width, height = img.size
+        if orientation in [6, 8]:
+            width, height = height, width
+        if self.original_image_width is None:
+            self.original_image_width = width
+        if self.original_image_height is None:
+            self.original_image_height = height
+        if self.orientation is None:
+            self.orientation = 1 if orientation is None else orientation
+
+        if settings.jpeg_draft and img.format == "JPEG":
+            self._draft(img, orientation, width, height)
+
+        # rotate the image according to the exif
+        if orientation == 3:
+            return img.rotate(180, expand=True)
+        elif orientation == 6:
+            return img.rotate(270, expand=True)
+        elif orientation == 8:
+            return img.rotate(90, expand=True)
+
+        # no rotation needed or unhandled rotation tag
+        return img
+
+    def _exif_orientation(self, img):
+        """Get the EXIF orientation of the image, or None if not defined"""
+        from PIL import ExifTags
+
+        # if there is no exif data, there is no orientation
+        exif = img._getexif() if hasattr(img, "_getexif") else None
         if exif is None:
-            return img
+            return None
 
         # get the orientation tag code from the ExifTags dict
         orientation = next(
@@ -90,184 +153,472 @@ class Photo(object):
         )
         if orientation is None:
             print("Couldn't find orientation tag in ExifTags.TAGS")
-            return img
+            return None
+        return exif.get(orientation, None)
+
+    def _draft(self, img, orientation, width, height):
+        """Let the JPEG decoder reduce the image while decoding
+
+        The decoder can scale the image down by a factor of 2, 4, or 8. We
+        ask for the smallest image that still covers the largest size that
+        needs to be created from it.
+        """
+        scale = 0.0
+        for mode in self.size_modes():
+            nwidth, nheight = self.resize_dims(mode)
+            if mode in ["thumb", "cover"]:
+                fit = min(width / nwidth, height / nheight)
+                required = CROP_MARGIN / fit
+            else:
+                required = max(nwidth / width, nheight / height)
+            scale = max(scale, required)
+        if scale >= 0.5:
+            return
 
-        # if no orientation is defined in the exif, return the image
-        if orientation not in exif:
-            return img
+        size = (math.ceil(width * scale), math.ceil(height * scale))
+        if orientation in [6, 8]:
+            size = (size[1], size[0])
+        img.draft(img.mode, size)
+        logging.info(
+            "[%s] Decoding original at reduced size: %ix%i"
+            % (self.name, img.size[0], img.size[1])
+        )
 
-        # rotate the image according to the exif
-        if exif[orientation] == 3:
-            return img.rotate(180, expand=True)
-        elif exif[orientation] == 6:
-            return img.rotate(270, expand=True)
-        elif exif[orientation] == 8:
-            return img.rotate(90, expand=True)
+    def _map_original(self):
+        """Map the original file in memory, or None if the file is empty
+
+        Both the checksum and the decoder read the original from this
+        mapping, so that the file only has to be read from disk once. The
+        mapped pages are backed by the file and can be released by the
+        operating system, which keeps memory use bounded for large files.
+        The file is mapped again if it has changed since it was mapped, in
+        which case an image decoded from the old mapping is closed as well.
+        """
+        signature = stat_signature(self.original_path)
+        if self._original_data is not None:
+            if signature == self._original_signature:
+                return self._original_data
+            self.free()
+        with open(self.original_path, "rb") as fp:
+            if os.fstat(fp.fileno()).st_size == 0:
+                return None
+            self._original_data = mmap.mmap(
+                fp.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        self._original_signature = signature
+        return self._original_data
 
-        # fallback for unhandled rotation tags
-        return img
+    def _unmap_original(self):
+        """Close the file mapping, unless an image is decoded from it"""
+        if self._original_img is not None:
+            return
+        if self._original_data is not None:
+            self._original_data.close()
+        self._original_data = None
+        self._original_signature = None
 
     def free(self):
-        """Manually clean up the cached image"""
+        """Manually clean up the cached image and file mapping"""
         if hasattr(self, "_original_img") and self._original_img:
             self._original_img.close()
             del self._original_img
         self._original_img = None
-
-    def has_sizes(self):
-        """Check if all necessary sizes exist on disk"""
-        if self.name is None:
-            return False
-        if not os.path.exists(self.large_path):
-            return False
-        if not os.path.exists(self.small_path):
-            return False
-        if not os.path.exists(self.thumb_path):
-            return False
-        if (self.cover_path is not None) and (
-            not os.path.exists(self.cover_path)
-        ):
+        if getattr(self, "_original_data", None) is not None:
+            self._original_data.close()
+        self._original_data = None
+        self._original_signature = None
+        self._saliency = None
+
+    def forget_dimensions(self):
+        """Forget the dimensions of the original and the paths based on them
+
+        This is needed when the original has changed, as the dimensions may
+        have been loaded from the album file. A loaded image is closed as
+        well, since it may have been decoded at a reduced size.
+        """
+        if self._original_img is not None:
+            self.free()
+        self.original_image_width = None
+        self.original_image_height = None
+        self.orientation = None
+        for name in ["large_path", "small_path", "thumb_path"]:
+            self.__dict__.pop(name, None)
+
+    def forget_placeholder(self):
+        """Forget the placeholder computed from an earlier original"""
+        self.color = None
+        self.blurhash = None
+        self.preview = None
+
+    def missing_placeholder(self):
+        """Check if the placeholder set in the settings is not computed yet"""
+        if settings.placeholder is None:
             return False
-        return True
+        return (
+            self.color is None
+            or getattr(self, settings.placeholder, None) is None
+        )
 
-    def create_sizes(self):
-        """Create all necessary sizes"""
+    def size_modes(self):
+        """The modes of the sizes that need to exist for this photo"""
+        modes = ["large", "small", "thumb"]
+        if self.cover_path is not None:
+            modes.append("cover")
+        if settings.dim_ladder:
+            modes.extend(self.ladder_modes())
+        return modes
+
+    def ladder_modes(self):
+        """The modes of the steps of the width ladder, from wide to narrow
+
+        Steps that are wider than the original are skipped, because they
+        would scale it up.
+        """
+        widths = sorted(set(settings.dim_ladder), reverse=True)
+        return ["ladder:%i" % w for w in widths if w <= self.width]
+
+    def size_path(self, mode):
+        """Path of the resized image of the given mode"""
+        if mode == "cover":
+            return self.cover_path
+        if mode.startswith("ladder:"):
+            return self._get_path(mode)
+        return getattr(self, mode + "_path")
+
+    def rendition_paths(self, mode):
+        """Paths of all the encodings of the resized image of a mode
+
+        The keys are the names of the renditions in the manifest: the mode
+        for the image in ``output_format``, and the mode and extension for
+        each of the ``extra_formats``.
+        """
+        pth = self.size_path(mode)
+        paths = {mode: pth}
+        for fmt in settings.extra_formats:
+            paths["%s.%s" % (mode, fmt)] = format_path(pth, fmt)
+        return paths
+
+    def stale_sizes(self, digest, existing=None):
+        """Get the modes of the sizes that need to be created
+
+        The rendition manifest in ``self.renditions`` records for every size
+        the file, the checksum of the original, and a fingerprint of the
+        settings it was created with. A size is stale if any of these differ
+        from the current ones, or if its file doesn't exist. If the photo has
+        no manifest at all and the original is unchanged, the sizes that
+        exist on disk are adopted, so that albums made before the manifest
+        existed don't have to be processed again. Otherwise a file that is
+        not in the manifest may have been made from another photo, as the
+        cover image can be. If given, ``existing`` is the set of paths of the
+        files in the output dirs, which is used instead of checking every
+        file on disk.
+        """
+        if self.name is None:
+            return self.size_modes()
+        if not digest == self.previous_sha256:
+            self.forget_dimensions()
+            self.forget_placeholder()
+        # crop boxes of an earlier version of the original are of no use
+        self.crops = {
+            k: v for k, v in self.crops.items() if k.startswith(digest + ":")
+        }
+
+        adopt = not self.renditions and digest == self.previous_sha256
+        stale = []
+        for mode in self.size_modes():
+            fingerprint = size_fingerprint(mode)
+            for key, pth in self.rendition_paths(mode).items():
+                if self._stale_rendition(
+                    key, pth, digest, fingerprint, existing, adopt
+                ):
+                    stale.append(mode)
+                    break
+        return stale
+
+    def _stale_rendition(self, key, pth, digest, fingerprint, existing, adopt):
+        expected = {
+            "file": os.path.relpath(pth, settings.output_dir),
+            "source": digest,
+            "settings": fingerprint,
+        }
+        if not path_exists(pth, existing):
+            return True
+        entry = self.renditions.get(key)
+        if entry is None:
+            if adopt:
+                self.renditions[key] = expected
+                return False
+            return True
+        return not entry == expected
+
+    def forget_cover(self):
+        """Remove the cover image from the manifest
+
+        This is needed when the photo is no longer the cover of the album,
+        as the file of the cover image will be made from another photo.
+        """
+        self.renditions = {
+            k: v
+            for k, v in self.renditions.items()
+            if k.split(".")[0] != "cover"
+        }
+
+    def create_sizes(self, modes=None):
+        """Create the sizes of the given modes, or all necessary sizes"""
         if self.name is None:
             print("Skipping file: %s. No name defined." % self.filename)
             return
-        logging.info("[%s] Creating large size." % self.name)
-        self.create_rescaled("large")
-        logging.info("[%s] Creating small size." % self.name)
-        self.create_rescaled("small")
-        logging.info("[%s] Creating thumbnail size." % self.name)
-        self.create_thumb(mode="thumb", pth=self.thumb_path)
-        if self.cover_path is not None:
-            logging.info(
-                "[%s] Creating thumbnail for cover image." % self.name
+        modes = self.size_modes() if modes is None else modes
+
+        # With the cascade enabled every size is created from the smallest
+        # image already in memory that is large enough for it, instead of
+        # from the original.
+        sources = [self.original_image]
+
+        # The placeholder is computed from the smallest resized image that
+        # shows the whole photo
+        smallest = self.original_image
+
+        for mode in ["large", "small"]:
+            if mode not in modes:
+                continue
+            logging.info("[%s] Creating %s size." % (self.name, mode))
+            source = self._cascade_source(mode, sources)
+            nimg = self._rescale(mode, source)
+            self._save(nimg, self.size_path(mode))
+            self._record_size(mode)
+            smallest = min(smallest, nimg, key=lambda img: img.width)
+            if settings.cascade_sizes:
+                sources.insert(0, nimg)
+
+        # Every step of the width ladder is resized from the previous, wider,
+        # step. The steps are created down to the narrowest one needed.
+        ladder = self.ladder_modes() if settings.dim_ladder else []
+        needed = [i for i, mode in enumerate(ladder) if mode in modes]
+        if needed:
+            source = self._cascade_source(ladder[0], sources)
+            for mode in ladder[: needed[-1] + 1]:
+                source = self._rescale(mode, source)
+                if mode not in modes:
+                    continue
+                self._save(source, self.size_path(mode))
+                self._record_size(mode)
+                smallest = min(smallest, source, key=lambda img: img.width)
+
+        # The thumbnail and cover are cropped from the same source, so they
+        # can share the saliency analysis if they need the same scale
+        crop_modes = [m for m in ["thumb", "cover"] if m in modes]
+        if crop_modes:
+            source = max(
+                (self._cascade_source(m, sources) for m in crop_modes),
+                key=lambda img: img.width,
+            )
+        for mode in crop_modes:
+            logging.info("[%s] Creating %s thumbnail." % (self.name, mode))
+            self.create_thumb(
+                mode=mode, pth=self.size_path(mode), source=source
             )
-            self.create_thumb(mode="cover", pth=self.cover_path)
+            self._record_size(mode)
 
-    def create_rescaled(self, mode):
-        """Do the actual resizing of images for modes without smartcrop"""
-        # get the desired dimensions
-        nwidth, nheight = self.resize_dims(mode)
-        logging.info(
-            "[%s] Creating %s image of dimensions: %ix%i"
-            % (self.name, mode, nwidth, nheight)
-        )
+        if self.missing_placeholder():
+            self.create_placeholder(source=smallest)
+
+    def create_placeholder(self, source=None):
+        """Compute the dominant colour and the placeholder of the photo"""
+        from . import placeholder
 
-        # resize the image with PIL
-        nimg = self.original_image.resize(
-            (nwidth, nheight), Image.Resampling.LANCZOS
+        source = self.original_image if source is None else source
+        logging.info(
+            "[%s] Creating %s placeholder." % (self.name, settings.placeholder)
         )
+        self.color = placeholder.dominant_color(source)
+        if settings.placeholder == "blurhash":
+            self.blurhash = placeholder.blurhash(source)
+        elif settings.placeholder == "preview":
+            self.preview = placeholder.preview(source)
+        else:
+            raise ValueError("Unknown placeholder: %s" % settings.placeholder)
 
+    def create_rescaled(self, mode, source=None):
+        """Do the actual resizing of images for modes without smartcrop"""
+        source = self.original_image if source is None else source
+        nimg = self._rescale(mode, source)
         pth = self.large_path if mode == "large" else self.small_path
         logging.info("[%s] Saving %s image to %s" % (self.name, mode, pth))
-        if settings.output_format == "jpg":
-            nimg.save(
-                pth,
-                optimize=settings.jpeg_optimize,
-                progressive=settings.jpeg_progressive,
-                quality=settings.jpeg_quality,
-            )
-        else:
-            nimg.save(pth)
-        return pth
+        return self._save(nimg, pth)
 
-    def create_thumb(self, mode=None, pth=None):
+    def create_thumb(self, mode=None, pth=None, source=None):
         """Create the image thumbnail"""
-        if settings.use_smartcrop_js:
-            return self.create_thumb_js(mode=mode, pth=pth)
-        return self.create_thumb_py(mode=mode, pth=pth)
-
-    def create_thumb_py(self, mode=None, pth=None):
+        backend = settings.crop_backend
+        if settings.use_smartcrop_js or backend == "smartcrop.js":
+            return self.create_thumb_js(mode=mode, pth=pth, source=source)
+        if backend == "numpy":
+            return self.create_thumb_numpy(mode=mode, pth=pth, source=source)
+        if backend == "smartcrop.py":
+            return self.create_thumb_py(mode=mode, pth=pth, source=source)
+        raise ValueError("Unknown crop backend: %s" % backend)
+
+    def create_thumb_py(self, mode=None, pth=None, source=None):
         """Create the thumbnail using SmartCrop.py"""
+        return self._create_thumb(
+            mode,
+            pth,
+            source,
+            self._crop_backend("smartcrop.py"),
+            self._find_crop_py,
+        )
+
+    def create_thumb_numpy(self, mode=None, pth=None, source=None):
+        """Create the thumbnail using the vectorised crop search"""
+        return self._create_thumb(
+            mode,
+            pth,
+            source,
+            self._crop_backend("numpy"),
+            self._find_crop_numpy,
+        )
+
+    def create_thumb_js(self, mode=None, pth=None, source=None):
+        """Create the thumbnail using SmartCrop.js"""
+        return self._create_thumb(
+            mode, pth, source, "smartcrop.js", self._find_crop_js
+        )
+
+    def _create_thumb(self, mode, pth, source, backend, find_crop):
+        """Crop and resize the thumbnail, reusing a stored crop if possible
+
+        Crop boxes are stored in ``self.crops`` in the coordinates of the
+        full original, keyed by the checksum of the original, the aspect
+        ratio of the thumbnail, and the crop backend.
+        """
+        from PIL import Image
+
         if pth is None:
             raise ValueError("path can't be None")
+        source = self.original_image if source is None else source
 
-        # Load smartcrop and set options
-        sc = smartcrop.SmartCrop()
-
-        # Get desired dimensions
         nwidth, nheight = self.resize_dims(mode)
-        factor = nwidth / 100.0
+        size = (self.width, self.height)
+        key = crop_key(self.sha256sum(), nwidth, nheight, backend)
+        if key in self.crops:
+            logging.info("[%s] Using stored crop box." % self.name)
+            box = scale_box(self.crops[key], size, source.size)
+        else:
+            box = find_crop(source, nwidth, nheight)
+            self.crops[key] = list(scale_box(box, source.size, size))
+
+        # Do the actual crop. A box that was scaled from another image can be
+        # a pixel off in aspect ratio, so it is resized to the exact size
+        # unless that would scale up.
+        left, upper, right, lower = box
+        if right - left >= nwidth and lower - upper >= nheight:
+            nimg = source.resize(
+                (nwidth, nheight), Image.Resampling.LANCZOS, box=box
+            )
+        else:
+            nimg = source.crop(box)
+            nimg.load()
+            nimg.thumbnail((nwidth, nheight), Image.Resampling.LANCZOS)
+
+        # Create the filename and save the thumbnail
+        logging.info("[%s] Saving %s thumbnail." % (self.name, mode))
+        return self._save(nimg, pth)
+
+    def _find_crop_py(self, source, nwidth, nheight):
+        """Find the crop box for a thumbnail using SmartCrop.py"""
+        from .saliency import SaliencyMap
 
-        crop_width = 100 if settings.fast else nwidth
-        crop_height = int(nheight / factor) if settings.fast else nheight
         logging.info(
             "[%s] SmartCrop.py new dimensions: %ix%i"
             % (self.name, nwidth, nheight)
         )
+        return self._find_crop(source, nwidth, nheight, SaliencyMap)
 
-        # Fix image mode if necessary
-        img = self.original_image.copy()
-        if img.mode not in ["RGB", "RGBA"]:
-            newimg = Image.new("RGB", img.size)
-            newimg.paste(img)
-            img = newimg
+    def _find_crop_numpy(self, source, nwidth, nheight):
+        """Find the crop box for a thumbnail using the vectorised search"""
+        from .saliency import NumpySaliencyMap
 
-        # Calculate the optimal crop size
         logging.info(
-            "[%s] SmartCrop.py computing optimal crop size." % self.name
-        )
-        ret = sc.crop(img, crop_width, crop_height)
-        box = (
-            ret["top_crop"]["x"],
-            ret["top_crop"]["y"],
-            ret["top_crop"]["width"] + ret["top_crop"]["x"],
-            ret["top_crop"]["height"] + ret["top_crop"]["y"],
+            "[%s] NumPy crop new dimensions: %ix%i"
+            % (self.name, nwidth, nheight)
         )
+        return self._find_crop(source, nwidth, nheight, NumpySaliencyMap)
 
-        # Do the actual crop
-        nimg = self.original_image.crop(box)
-        nimg.load()
-        nimg.thumbnail((nwidth, nheight), Image.Resampling.LANCZOS)
+    def _find_crop(self, source, nwidth, nheight, saliency_class):
+        from .saliency import MIN_SCALE
 
-        # Create the filename and save the thumbnail
-        logging.info("[%s] Saving SmartCrop.py thumbnail." % self.name)
-        if settings.output_format == "jpg":
-            nimg.save(
-                pth,
-                optimize=settings.jpeg_optimize,
-                progressive=settings.jpeg_progressive,
-                quality=settings.jpeg_quality,
-            )
-        else:
-            nimg.save(pth)
-        return pth
+        crop_width, crop_height = self._crop_target(nwidth, nheight)
+        saliency = self._saliency_map(source, nwidth, nheight, saliency_class)
 
-    def create_thumb_js(self, mode=None, pth=None):
-        """Create the thumbnail using SmartCrop.js"""
-        if pth is None:
-            raise ValueError("path can't be None")
+        # don't pick crops that would need upscaling
+        scale = min(source.width / crop_width, source.height / crop_height)
+        min_scale = min(1.0, max(1 / scale, MIN_SCALE))
 
-        # save a copy of the image with the correct orientation in a temporary
-        # file
-        _, tmpfname = tempfile.mkstemp(suffix="." + settings.output_format)
-        self.original_image.save(tmpfname, quality=95)
+        # Calculate the optimal crop size
+        logging.info("[%s] Computing optimal crop size." % self.name)
+        box = saliency.crop(crop_width, crop_height, min_scale=min_scale)
+        return scale_box(box, saliency.size, source.size)
+
+    def _crop_backend(self, name):
+        """Name of a crop backend including the options that affect it"""
+        if settings.fast:
+            name += ":fast"
+        if settings.crop_analysis_size:
+            name += ":%s" % settings.crop_analysis_size
+        return name
+
+    def _crop_target(self, nwidth, nheight):
+        """Dimensions that SmartCrop.py searches a crop for"""
+        if not settings.fast:
+            return nwidth, nheight
+        factor = nwidth / 100.0
+        return 100, int(nheight / factor)
+
+    def _saliency_map(self, source, nwidth, nheight, saliency_class):
+        """Saliency map of the source for a crop of the given dimensions
+
+        The map is computed at the scale that SmartCrop.py analyses the crop
+        at. It is reused for the next crop if that is made from the same
+        source at the same scale.
+        """
+        from .saliency import analysis_scale
+
+        # Analyse a downscaled proxy of the image if requested
+        img = source
+        if settings.crop_analysis_size:
+            img = analysis_proxy(source, int(settings.crop_analysis_size))
+
+        crop_width, crop_height = self._crop_target(nwidth, nheight)
+        scale = analysis_scale(img.size, crop_width, crop_height)
+
+        if (
+            self._saliency is not None
+            and self._saliency[0] is source
+            and self._saliency[1] == scale
+            and isinstance(self._saliency[2], saliency_class)
+        ):
+            return self._saliency[2]
+
+        logging.info("[%s] Computing saliency map." % self.name)
+        saliency = saliency_class.from_image(img, scale)
+        self._saliency = (source, scale, saliency)
+        return saliency
+
+    def _find_crop_js(self, source, nwidth, nheight):
+        """Find the crop box for a thumbnail using SmartCrop.js"""
+        from . import smartcrop_js
 
-        # Load smartcrop and set options
-        nwidth, nheight = self.resize_dims(mode)
         logging.info(
             "[%s] SmartCrop.js new dimensions: %ix%i"
             % (self.name, nwidth, nheight)
         )
-        command = [
-            settings.smartcrop_js_path,
-            "--width",
-            str(nwidth),
-            "--height",
-            str(nheight),
-            tmpfname,
-            pth,
-        ]
-        logging.info("[%s] SmartCrop.js running crop command." % self.name)
-        check_output(command)
-
-        # remove the temporary file
-        os.remove(tmpfname)
 
-        return pth
+        # The worker receives a downscaled copy of the image and returns the
+        # crop box
+        logging.info(
+            "[%s] SmartCrop.js computing optimal crop size." % self.name
+        )
+        return smartcrop_js.get_worker().crop(source, nwidth, nheight)
 
     def resize_dims(self, mode):
         """Calculate the width and height of the resized image"""
@@ -281,6 +632,8 @@ class Photo(object):
             desired_max_dim = settings.dim_max_thumb
         elif mode == "cover":
             desired_max_dim = settings.dim_max_cover
+        elif mode.startswith("ladder:"):
+            desired_max_dim = mode[len("ladder:") :] + "x"
         else:
             raise ValueError("Unkown mode provided")
 
@@ -315,15 +668,25 @@ class Photo(object):
 
         return nwidth, nheight
 
-    def sha256sum(self):
-        blocksize = 65536
-        hasher = hashlib.sha256()
-        with open(self.original_path, "rb") as fp:
-            buf = fp.read(blocksize)
-            while buf:
-                hasher.update(buf)
-                buf = fp.read(blocksize)
-        return hasher.hexdigest()
+    def sha256sum(self, keep_mapping=True):
+        """Checksum of the original file
+
+        The checksum is remembered for as long as the size, modification
+        time, and inode of the file don't change. The original stays mapped
+        so that it can be decoded without reading it again, unless
+        ``keep_mapping`` is False and no image is decoded from it yet.
+        """
+        signature = stat_signature(self.original_path)
+        if self._sha256 is not None and self._sha256[0] == signature:
+            return self._sha256[1]
+
+        data = self._map_original()
+        hasher = hashlib.sha256(b"" if data is None else data)
+        digest = hasher.hexdigest()
+        self._sha256 = (signature, digest)
+        if not keep_mapping:
+            self._unmap_original()
+        return digest
 
     @property
     def clean_name(self):
@@ -344,9 +707,9 @@ class Photo(object):
         return self._get_path("thumb")
 
     def _get_path(self, mode):
-        mode_dir = getattr(settings, f"dirname_{mode}")
+        dirname = "ladder" if mode.startswith("ladder:") else mode
+        mode_dir = getattr(settings, f"dirname_{dirname}")
         thedir = os.path.join(settings.output_dir, self.album_name, mode_dir)
-        os.makedirs(thedir, exist_ok=True)
         width, height = self.resize_dims(mode)
         ext = settings.output_format
         fname = f"{self.clean_name}_{width:d}x{height:d}.{ext}"
@@ -385,10 +748,55 @@ class Photo(object):
         caption = "" if self.caption is None else self.caption.strip()
         copyright = "" if self.copyright is None else self.copyright.strip()
         alt = "" if self.alt is None else self.alt.strip()
+
+        # urls of the extra formats, e.g. largeUrlWebp="..."
+        extra = ""
+        for fmt in settings.extra_formats:
+            for mode, pth in [
+                ("large", large_path),
+                ("small", small_path),
+                ("thumb", thumb_path),
+            ]:
+                extra += '%sUrl%s="%s" ' % (
+                    mode,
+                    fmt.capitalize(),
+                    format_path(pth, fmt),
+                )
+
+        # url and width of the steps of the width ladder, e.g.
+        # srcset="a_320x213.jpg 320w, a_640x427.jpg 640w", which are left out
+        # if no step is narrower than the original
+        steps = []
+        for mode in reversed(self.ladder_modes()):
+            pth = (prefix + self.size_path(mode)[L:]).replace("\\", "/")
+            steps.append((pth, self.resize_dims(mode)[0]))
+        if steps:
+            extra += 'srcset="%s" ' % ", ".join(
+                "%s %iw" % (pth, w) for pth, w in steps
+            )
+            for fmt in settings.extra_formats:
+                extra += 'srcset%s="%s" ' % (
+                    fmt.capitalize(),
+                    ", ".join(
+                        "%s %iw" % (format_path(pth, fmt), w)
+                        for pth, w in steps
+                    ),
+                )
+
+        # the placeholder is read from the album file, not from the image
+        if settings.placeholder is not None:
+            value = getattr(self, settings.placeholder, None)
+            if self.color is not None and value is not None:
+                extra += 'color="%s" %s="%s" ' % (
+                    self.color,
+                    settings.placeholder,
+                    value,
+                )
+
         shortcode = (
             '{{{{< photo href="{large}" largeDim="{large_dim}" '
             'smallUrl="{small}" smallDim="{small_dim}" alt="{alt}" '
-            'thumbSize="{thumb_dim}" thumbUrl="{thumb}" '
+            'thumbSize="{thumb_dim}" thumbUrl="{thumb}" {extra}'
             'caption="{caption}" copyright="{copyright}" '
             ">}}}}"
         ).format(
@@ -398,6 +806,7 @@ class Photo(object):
             small_dim=small_dim,
             thumb=thumb_path,
             thumb_dim=thumb_dim,
+            extra=extra,
             alt=alt,
             caption=caption,
             copyright=copyright,
@@ -408,16 +817,85 @@ class Photo(object):
     def width(self):
         """The width of the original image"""
         if self.original_image_width is None:
-            self.original_image_width = self.original_image.width
+            # loading the image sets the width of the original, which differs
+            # from the width of the image if it is decoded at a reduced size
+            self.original_image
         return self.original_image_width
 
     @property
     def height(self):
         """The height of the original image"""
         if self.original_image_height is None:
-            self.original_image_height = self.original_image.height
+            # loading the image sets the height of the original, which differs
+            # from the height of the image if it is decoded at a reduced size
+            self.original_image
         return self.original_image_height
 
+    def _rescale(self, mode, source):
+        """Resize the source image to the dimensions of the given mode"""
+        from PIL import Image
+
+        nwidth, nheight = self.resize_dims(mode)
+        logging.info(
+            "[%s] Creating %s image of dimensions: %ix%i"
+            % (self.name, mode, nwidth, nheight)
+        )
+        return source.resize((nwidth, nheight), Image.Resampling.LANCZOS)
+
+    def _cascade_source(self, mode, sources):
+        """Pick the image to create the given mode from
+
+        The sources are ordered from small to large and the last one is always
+        the original image. The first source that covers the dimensions of the
+        mode is used, with some headroom for the crop search of thumbnails.
+        """
+        if not settings.cascade_sizes:
+            return sources[-1]
+        nwidth, nheight = self.resize_dims(mode)
+        margin = CROP_MARGIN if mode in ["thumb", "cover"] else 1.0
+        for source in sources[:-1]:
+            if min(source.width / nwidth, source.height / nheight) >= margin:
+                return source
+        return sources[-1]
+
+    def _record_size(self, mode):
+        """Add the encodings of a created size to the rendition manifest"""
+        fingerprint = size_fingerprint(mode)
+        for key, pth in self.rendition_paths(mode).items():
+            self.renditions[key] = {
+                "file": os.path.relpath(pth, settings.output_dir),
+                "source": self.sha256sum(),
+                "settings": fingerprint,
+            }
+
+    def _save(self, img, pth):
+        """Save an image using the output settings
+
+        The image is saved in ``output_format`` to the given path, and in
+        each of the ``extra_formats`` next to it. The output dirs are created
+        by the album before the photos are processed, they are only created
+        here if they don't exist.
+        """
+        try:
+            return self._write(img, pth)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(pth), exist_ok=True)
+            return self._write(img, pth)
+
+    def _write(self, img, pth):
+        if settings.output_format == "jpg":
+            img.save(
+                pth,
+                optimize=settings.jpeg_optimize,
+                progressive=settings.jpeg_progressive,
+                quality=settings.jpeg_quality,
+            )
+        else:
+            img.save(pth)
+        for fmt in settings.extra_formats:
+            img.save(format_path(pth, fmt))
+        return pth
+
     def __key(self):
         return (self.original_path, self.name, self.alt, self.caption)
 
@@ -428,8 +906,18 @@ class Photo(object):
         s = "Photo(original=%r, name=%r)" % (self.original_path, self.name)
         return s
 
+    def __getstate__(self):
+        # the decoded image is not sent to other processes
+        state = self.__dict__.copy()
+        state["_original_img"] = None
+        state["_original_data"] = None
+        state["_original_signature"] = None
+        state["_saliency"] = None
+        return state
+
     def __hash__(self):
-        return int(float.fromhex(self.sha256sum()))
+        # equal photos have the same original, so this is consistent with eq
+        return hash(self.original_path)
 
     def __lt__(self, other):
         return self.original_path < other.original_path
@@ -439,3 +927,87 @@ class Photo(object):
 
     def __del__(self):
         self.free()
+
+
+def size_fingerprint(mode):
+    """Fingerprint of the settings that determine the image of a mode
+
+    When sizes are cascaded or originals are decoded at reduced size, the
+    image of a mode also depends on the dimensions of the other modes.
+    """
+    keys = [
+        "output_format",
+        "jpeg_optimize",
+        "jpeg_progressive",
+        "jpeg_quality",
+        "cascade_sizes",
+        "jpeg_draft",
+    ]
+    if settings.cascade_sizes or settings.jpeg_draft:
+        keys.extend(
+            "dim_max_" + m for m in ["large", "small", "thumb", "cover"]
+        )
+        if settings.dim_ladder:
+            keys.append("dim_ladder")
+    elif mode.startswith("ladder:"):
+        # every step is resized from the previous one
+        keys.append("dim_ladder")
+    else:
+        keys.append("dim_max_" + mode)
+    if mode in ["thumb", "cover"]:
+        keys.extend(["use_smartcrop_js", "fast"])
+        if not settings.crop_backend == "smartcrop.py":
+            keys.append("crop_backend")
+        if settings.crop_analysis_size:
+            keys.append("crop_analysis_size")
+    values = {key: getattr(settings, key) for key in keys}
+    blob = json.dumps(values, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(blob).hexdigest()
+
+
+def format_path(pth, fmt):
+    """Path of the encoding of an image in another format"""
+    return os.path.splitext(pth)[0] + "." + fmt
+
+
+def path_exists(pth, existing=None):
+    """Check if a file exists, in the set of existing paths if it is given"""
+    if existing is None:
+        return os.path.exists(pth)
+    return pth in existing
+
+
+def crop_key(digest, width, height, backend):
+    """Key of a crop box in the crop cache
+
+    The crop only depends on the aspect ratio of the thumbnail, so the key
+    contains the reduced ratio rather than the dimensions.
+    """
+    divisor = math.gcd(width, height)
+    return "%s:%i:%i:%s" % (
+        digest,
+        width // divisor,
+        height // divisor,
+        backend,
+    )
+
+
+def analysis_proxy(image, size):
+    """Downscaled copy of an image for finding the thumbnail crop
+
+    The longest side of the proxy is at most ``size`` pixels. Pillow reduces
+    the image by an integer factor before resampling, so the full image is
+    never copied.
+    """
+    from PIL import Image
+
+    scale = size / max(image.size)
+    if scale >= 1.0:
+        return image.copy()
+    proxy_size = (
+        max(1, round(scale * image.width)),
+        max(1, round(scale * image.height)),
+    )
+    return image.resize(
+        proxy_size, Image.Resampling.BILINEAR, reducing_gap=2.0
+    )
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+"""Compact placeholders that are shown while the thumbnails load
+
+The placeholders are computed from a small copy of a photo while its sizes
+are created, and stored in the album file. Two kinds are supported: a
+BlurHash string (see https://blurha.sh), which is decoded to a blurred image
+in the browser, and a tiny WebP image encoded as a data URI. Both come with
+the dominant colour of the photo, which can be used as a background.
+
+Author: Gertjan van den Burg
+License: GPL v3.
+
+"""
+
+import base64
+import io
+
+import numpy as np
+
+from PIL import Image
+
+# Number of cosine components of the BlurHash in each direction
+BLURHASH_COMPONENTS = (4, 3)
+
+# BlurHash only keeps the lowest frequencies, so it is computed on an image
+# reduced to this size
+BLURHASH_SIZE = 32
+
+# Size and quality of the preview image
+PREVIEW_SIZE = 20
+PREVIEW_QUALITY = 50
+
+# Number of colours the dominant colour is chosen from
+PALETTE_SIZE = 8
+
+BASE83 = (
+    "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+    "#$%*+,-.:;=?@[]^_{|}~"
+)
+
+
+def shrink(image, size):
+    """Reduce an image so that its longest side is at most the given size"""
+    scale = min(1.0, size / max(image.size))
+    if scale < 1.0:
+        new_size = (
+            max(1, round(scale * image.width)),
+            max(1, round(scale * image.height)),
+        )
+        image = image.resize(new_size, Image.Resampling.BOX, reducing_gap=2.0)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+def dominant_color(image):
+    """The most common colour of the image as a hex string"""
+    small = shrink(image, 64)
+    palette = small.quantize(
+        colors=PALETTE_SIZE, method=Image.Quantize.MEDIANCUT
+    )
+    _, index = max(palette.getcolors())
+    r, g, b = palette.getpalette()[3 * index : 3 * index + 3]
+    return "#%02x%02x%02x" % (r, g, b)
+
+
+def preview(image):
+    """A tiny WebP copy of the image as a data URI"""
+    small = shrink(image, PREVIEW_SIZE)
+    fid = io.BytesIO()
+    small.save(fid, format="WEBP", quality=PREVIEW_QUALITY)
+    data = base64.b64encode(fid.getvalue()).decode("ascii")
+    return "data:image/webp;base64," + data
+
+
+def blurhash(image, components=BLURHASH_COMPONENTS):
+    """The BlurHash string of the image"""
+    cx, cy = components
+    small = shrink(image, BLURHASH_SIZE)
+    linear = _srgb_to_linear(np.asarray(small, dtype=np.float64))
+    height, width = linear.shape[:2]
+
+    # the factors are the projections of the image on products of cosines
+    basis_x = np.cos(np.pi * np.outer(np.arange(cx), np.arange(width)) / width)
+    basis_y = np.cos(
+        np.pi * np.outer(np.arange(cy), np.arange(height)) / height
+    )
+    factors = np.einsum("jy,ix,yxc->jic", basis_y, basis_x, linear)
+    factors /= width * height
+    factors[1:] *= 2
+    factors[0, 1:] *= 2
+    factors = factors.reshape(-1, 3)
+    dc, ac = factors[0], factors[1:]
+
+    result = _base83((cx - 1) + (cy - 1) * 9, 1)
+    if len(ac):
+        actual_max = np.max(np.abs(ac))
+        quantised_max = int(max(0, min(82, np.floor(actual_max * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+        result += _base83(quantised_max, 1)
+    else:
+        max_value = 1
+        result += _base83(0, 1)
+
+    r, g, b = (_linear_to_srgb(v) for v in dc)
+    result += _base83((r << 16) + (g << 8) + b, 4)
+
+    quantised = np.floor(_sign_pow(ac / max_value, 0.5) * 9 + 9.5)
+    quantised = np.clip(quantised, 0, 18).astype(int)
+    for qr, qg, qb in quantised:
+        result += _base83(qr * 19 * 19 + qg * 19 + qb, 2)
+    return result
+
+
+def _base83(value, length):
+    digits = []
+    for _ in range(length):
+        value, digit = divmod(value, 83)
+        digits.append(BASE83[digit])
+    return "".join(reversed(digits))
+
+
+def _srgb_to_linear(value):
+    v = value / 255
+    return np.where(v <= 0.04045, v / 12.92, ((v + 0.055) / 1.055) ** 2.4)
+
+
+def _linear_to_srgb(value):
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value, exp):
+    return np.sign(value) * np.abs(value) ** exp
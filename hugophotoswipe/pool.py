@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+"""Render photos in a pool of worker processes
+
+Creating the resized images is by far the most expensive part of updating an
+album, and every photo can be processed independently. The functions in this
+file spread this work over several processes when the user asks for it with
+the ``--jobs`` flag. The daemon keeps a pool open between updates, so that
+starting the worker processes isn't part of every update.
+
+Author: Gertjan van den Burg
+License: GPL v3.
+
+"""
+
+import logging
+import multiprocessing
+
+from .config import settings
+
+# The pool that is kept open by ``start_pool``
+_pool = None
+
+
+def render_photos(photos, jobs=1):
+    """Create the sizes of the given photos and yield them when done
+
+    When ``jobs`` is larger than one the photos are rendered by a pool of
+    worker processes. Every worker decodes its own copy of the photo, and the
+    state it computes is copied back onto the photo object that was passed in
+    before it is yielded. Photos are yielded in order of completion. A
+    progress bar is shown in verbose mode.
+    """
+    photos = list(photos)
+    if not photos:
+        return
+    iterator = _render_photos(photos, jobs)
+    if settings.verbose:
+        from tqdm import tqdm
+
+        iterator = tqdm(iterator, total=len(photos), desc="Progress")
+    yield from iterator
+
+
+def _render_photos(photos, jobs):
+    if jobs <= 1 or len(photos) <= 1:
+        for photo in photos:
+            _render(photo)
+            yield photo
+        return
+
+    if _pool is not None:
+        yield from _render_in_pool(_pool, photos)
+        return
+
+    with multiprocessing.Pool(processes=min(jobs, len(photos))) as pool:
+        yield from _render_in_pool(pool, photos)
+
+
+def _render_in_pool(pool, photos):
+    # The settings are sent with every photo, as they may have changed since
+    # a long-lived pool was started.
+    settings_dict = dict(settings.__dict__)
+    tasks = ((idx, photo, settings_dict) for idx, photo in enumerate(photos))
+    for idx, state in pool.imap_unordered(_render_task, tasks):
+        photos[idx].__dict__.update(state)
+        yield photos[idx]
+
+
+def start_pool(jobs):
+    """Keep a pool of worker processes open for all following renders"""
+    global _pool
+    close_pool()
+    if jobs > 1:
+        _pool = multiprocessing.Pool(processes=jobs)
+
+
+def close_pool():
+    """Stop the pool of worker processes started by ``start_pool``"""
+    global _pool
+    if _pool is None:
+        return
+    _pool.close()
+    _pool.join()
+    _pool = None
+
+
+def _render(photo):
+    # Compute the checksum first, so the decoder reads the original from the
+    # same mapping of the file.
+    modes = photo.stale_sizes(photo.sha256sum())
+    if modes or photo.missing_placeholder():
+        photo.create_sizes(modes)
+    else:
+        logging.info("[%s] Photo is unchanged, keeping sizes." % photo.name)
+    photo.free()
+
+
+def _render_task(task):
+    idx, photo, settings_dict = task
+    # make the settings of the worker equal to those of the main process
+    settings.__dict__.update(settings_dict)
+    _render(photo)
+    return idx, photo.__getstate__()
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+
+"""Find thumbnail crops with SmartCrop.py
+
+SmartCrop scores candidate crops on a map of the skin, edge, and saturation
+features of an image. This map doesn't depend on the aspect ratio of the crop
+that is searched for, so the SaliencyMap class computes it once and uses it to
+find all crops that SmartCrop.py analyses at the same scale.
+
+The NumpySaliencyMap class finds nearly the same crops as SmartCrop.py, but
+is much faster. It is used when the ``crop_backend`` setting is ``numpy``.
+
+Author: Gertjan van den Burg
+License: GPL v3.
+
+"""
+
+import functools
+import math
+
+import numpy as np
+import smartcrop
+
+from numpy.lib.stride_tricks import sliding_window_view
+from PIL import Image
+
+# Smallest size of a candidate crop relative to the largest crop that fits
+MIN_SCALE = 0.9
+
+# Matrix with which SmartCrop.py computes the luminance of an image
+LUMINANCE = (0.2126, 0.7152, 0.0722, 0)
+
+# Bits per channel of the colours for which the numpy backend tabulates the
+# skin and saturation features
+COLOUR_BITS = 5
+
+# Largest ratio of the size of a reduced image to that of the map that the
+# numpy backend analyses it for
+REDUCE_TOLERANCE = 1.02
+
+
+def analysis_scale(size, crop_width, crop_height):
+    """Factor by which SmartCrop.py reduces an image to find a crop
+
+    Reducing the image such that the crop is at most the requested size
+    doesn't change which crop is found, but is much faster.
+    """
+    scale = min(size[0] / crop_width, size[1] / crop_height)
+    min_scale = min(1.0, max(1 / scale, MIN_SCALE))
+    return min(1.0, 1 / scale / min_scale)
+
+
+class SaliencyMap(object):
+    def __init__(self, image, sc=None):
+        self.sc = smartcrop.SmartCrop() if sc is None else sc
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        self.size = image.size
+
+        down_sample = self.sc.score_down_sample
+        features = self.sc.prepare_features_image(image)
+        features = features.resize(
+            (
+                math.ceil(image.width / down_sample),
+                math.ceil(image.height / down_sample),
+            ),
+            Image.Resampling.LANCZOS,
+        )
+        self.features = self.sc.precompute_features(features)
+        self.prescore = np.sum(self.features) * self.sc.outside_importance
+        self._importances = {}
+
+    @classmethod
+    def from_image(cls, image, scale, sc=None):
+        """Saliency map of an image at the given analysis scale
+
+        The image is resampled to the scale as SmartCrop.py does it.
+        """
+        if scale < 1.0:
+            image = image.resize(
+                (int(image.width * scale), int(image.height * scale)),
+                Image.Resampling.LANCZOS,
+            )
+        return cls(image, sc=sc)
+
+    def crop(self, crop_width, crop_height, min_scale=MIN_SCALE, step=8):
+        """Find the best crop with the aspect ratio of the given dimensions
+
+        Candidate crops are the largest crop with this aspect ratio that fits
+        in the image and the crop reduced by ``min_scale``. Returns the crop
+        box as a (left, upper, right, lower) tuple in the coordinates of the
+        analysed image.
+        """
+        width, height = self.size
+        scale = min(width / crop_width, height / crop_height)
+        crop_width = int(math.floor(crop_width * scale))
+        crop_height = int(math.floor(crop_height * scale))
+
+        best, best_score = None, None
+        inv_down_sample = 1 / self.sc.score_down_sample
+        for crop_scale in sorted(set([1.0, min_scale]), reverse=True):
+            cw = math.ceil(crop_width * crop_scale)
+            ch = math.ceil(crop_height * crop_scale)
+            fw, fh = int(cw * inv_down_sample), int(ch * inv_down_sample)
+            importance = self._importance(fw, fh)
+            for y in range(0, height - ch + 1, step):
+                fy = int(y * inv_down_sample)
+                for x in range(0, width - cw + 1, step):
+                    fx = int(x * inv_down_sample)
+                    window = self.features[fy : fy + fh, fx : fx + fw]
+                    score = self.prescore + np.sum(window * importance)
+                    score = score / (fw * fh)
+                    if best_score is None or score > best_score:
+                        best, best_score = (x, y, x + cw, y + ch), score
+        return best
+
+    def _importance(self, width, height):
+        if (width, height) not in self._importances:
+            importance = self.sc.get_importance(height=height, width=width)
+            importance -= self.sc.outside_importance
+            self._importances[(width, height)] = importance
+        return self._importances[(width, height)]
+
+
+class NumpySaliencyMap(object):
+    """Saliency map computed and scored with vectorised NumPy operations
+
+    The features are those of SmartCrop.py, computed on whole arrays: the
+    edges with integer arithmetic, and the skin and the saturation with a
+    table of their value for every colour. They are averaged over the blocks
+    of the score resolution, and all candidate crops of a size are scored at
+    once by correlating the map with the importance of the crop.
+
+    The image may be smaller or larger than the map, in which case the
+    features are averaged over the blocks of the map that they cover.
+    """
+
+    def __init__(self, image, sc=None, size=None):
+        self.sc = smartcrop.SmartCrop() if sc is None else sc
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        self.size = image.size if size is None else size
+
+        cie = np.asarray(image.convert("L", LUMINANCE))
+        detail = self._downsample(self._edge(cie)) / 255
+
+        # The skin and saturation vary slowly over the image, so they are
+        # computed at half the resolution
+        skin, saturation = self._colour(image.reduce(2))
+        skin = self._downsample(skin) / 255
+        saturation = self._downsample(saturation) / 255
+
+        sc = self.sc
+        self.features = (
+            skin * (detail + sc.skin_bias) * sc.skin_weight
+            + detail * sc.detail_weight
+            + saturation * (detail + sc.saturation_bias) * sc.saturation_weight
+        )
+        self.prescore = np.sum(self.features) * sc.outside_importance
+        self._importances = {}
+
+    @classmethod
+    def from_image(cls, image, scale, sc=None):
+        """Saliency map of an image at the given analysis scale
+
+        Instead of resampling the image to the scale, it is reduced by an
+        integer factor to at most slightly larger than the map. This is much
+        faster, and the crops barely change.
+        """
+        if scale >= 1.0:
+            return cls(image, sc=sc)
+        size = (int(image.width * scale), int(image.height * scale))
+        factor = math.ceil(1 / scale / REDUCE_TOLERANCE)
+        if factor > 1:
+            image = image.reduce(factor)
+        return cls(image, sc=sc, size=size)
+
+    def crop(self, crop_width, crop_height, min_scale=MIN_SCALE, step=8):
+        """Find the best crop with the aspect ratio of the given dimensions
+
+        The candidate crops are those of ``SaliencyMap.crop``. Returns the crop
+        box as a (left, upper, right, lower) tuple in the coordinates of the
+        analysed image.
+        """
+        width, height = self.size
+        scale = min(width / crop_width, height / crop_height)
+        crop_width = int(math.floor(crop_width * scale))
+        crop_height = int(math.floor(crop_height * scale))
+
+        best, best_score = None, None
+        inv_down_sample = 1 / self.sc.score_down_sample
+        for crop_scale in sorted(set([1.0, min_scale]), reverse=True):
+            cw = math.ceil(crop_width * crop_scale)
+            ch = math.ceil(crop_height * crop_scale)
+            xs = np.arange(0, width - cw + 1, step)
+            ys = np.arange(0, height - ch + 1, step)
+            if not len(xs) or not len(ys):
+                continue
+            fw, fh = int(cw * inv_down_sample), int(ch * inv_down_sample)
+            fx = (xs * inv_down_sample).astype(int)
+            fy = (ys * inv_down_sample).astype(int)
+            scores = self._scores(fx, fy, fw, fh)
+            idx = np.argmax(scores)
+            if best_score is None or scores.flat[idx] > best_score:
+                iy, ix = np.unravel_index(idx, scores.shape)
+                x, y = int(xs[ix]), int(ys[iy])
+                best, best_score = (x, y, x + cw, y + ch), scores.flat[idx]
+        return best
+
+    def _scores(self, fx, fy, fw, fh):
+        """Scores of the crops of a size at all given offsets"""
+        importance = self._importance(fw, fh)
+        windows = sliding_window_view(self.features, (fh, fw))[fy][:, fx]
+        total = self.prescore + np.tensordot(windows, importance, axes=2)
+        return total / (fw * fh)
+
+    def _importance(self, width, height):
+        if (width, height) not in self._importances:
+            importance = self.sc.get_importance(height=height, width=width)
+            importance -= self.sc.outside_importance
+            self._importances[(width, height)] = importance
+        return self._importances[(width, height)]
+
+    def _downsample(self, feature):
+        """Average a feature over the blocks of the score resolution"""
+        ds = self.sc.score_down_sample
+        width, height = self.size
+        blocks = (math.ceil(width / ds), math.ceil(height / ds))
+
+        # the blocks cover whole multiples of the down sample factor of the
+        # map, which are extended by repeating the border of the feature
+        box = (
+            0,
+            0,
+            blocks[0] * ds * feature.shape[1] / width,
+            blocks[1] * ds * feature.shape[0] / height,
+        )
+        ph = max(0, math.ceil(box[3]) - feature.shape[0])
+        pw = max(0, math.ceil(box[2]) - feature.shape[1])
+        if ph or pw:
+            feature = np.pad(feature, ((0, ph), (0, pw)), mode="edge")
+        image = Image.fromarray(feature.astype(np.float32), "F")
+        image = image.resize(blocks, Image.Resampling.BOX, box=box)
+        return np.asarray(image)
+
+    def _edge(self, cie):
+        # Laplacian of the luminance with the offset of SmartCrop.py, the
+        # border is left as it is
+        edge = cie.astype(np.int16)
+        edge[1:-1, 1:-1] = (
+            4 * edge[1:-1, 1:-1]
+            - edge[:-2, 1:-1]
+            - edge[2:, 1:-1]
+            - edge[1:-1, :-2]
+            - edge[1:-1, 2:]
+            + 1
+        )
+        return np.clip(edge, 0, 255).astype(np.uint8)
+
+    def _colour(self, image):
+        """Skin and saturation features of an image"""
+        sc = self.sc
+        table = _colour_table(
+            tuple(sc.skin_color),
+            (
+                sc.skin_threshold,
+                sc.skin_brightness_min,
+                sc.skin_brightness_max,
+            ),
+            (
+                sc.saturation_threshold,
+                sc.saturation_brightness_min,
+                sc.saturation_brightness_max,
+            ),
+        )
+        rgb = np.asarray(image) >> (8 - COLOUR_BITS)
+        index = rgb[..., 0].astype(np.uint16) << (2 * COLOUR_BITS)
+        index |= rgb[..., 1].astype(np.uint16) << COLOUR_BITS
+        index |= rgb[..., 2]
+        features = np.take(table, index, axis=0)
+        return features[..., 0], features[..., 1]
+
+
+@functools.lru_cache()
+def _colour_table(skin_color, skin, saturation):
+    """Skin and saturation features for all colours
+
+    The colours are quantised to ``COLOUR_BITS`` bits per channel. The
+    features of the colour with the quantised channels ``r``, ``g``, and ``b``
+    are in the row ``(r << 2 * COLOUR_BITS) | (g << COLOUR_BITS) | b``. They
+    are computed as in ``SmartCrop.detect_skin`` and
+    ``SmartCrop.detect_saturation`` for the centre of the quantisation bin.
+    The ``skin`` and ``saturation`` tuples hold the threshold and the minimum
+    and maximum brightness of the feature.
+    """
+    step = 256 >> COLOUR_BITS
+    values = np.arange(0, 256, step, dtype=np.float32) + (step - 1) / 2
+    r, g, b = np.meshgrid(values, values, values, indexing="ij")
+    cie = LUMINANCE[0] * r + LUMINANCE[1] * g + LUMINANCE[2] * b
+
+    def threshold(data, threshold, min_cie, max_cie):
+        mask = (data > threshold) & (cie >= min_cie * 255)
+        mask &= cie <= max_cie * 255
+        value = (data - threshold) * (255 / (1 - threshold))
+        return np.where(mask, value, 0).astype(np.uint8)
+
+    mag = np.sqrt(r * r + g * g + b * b) + 0.001
+    rd = r / mag - skin_color[0]
+    gd = g / mag - skin_color[1]
+    bd = b / mag - skin_color[2]
+    skin_value = threshold(1 - np.sqrt(rd * rd + gd * gd + bd * bd), *skin)
+
+    maximum = np.maximum(np.maximum(r, g), b)
+    minimum = np.minimum(np.minimum(r, g), b)
+    s = (maximum + minimum) / 255
+    d = (maximum - minimum) / 255
+    s[maximum == minimum] = 0.001
+    s = np.where(s > 1, 2 - s, s)
+    saturation_value = threshold(d / s, *saturation)
+
+    return np.stack([skin_value.ravel(), saturation_value.ravel()], axis=1)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+"""Find thumbnail crops with a long-lived SmartCrop.js worker
+
+Starting node and writing the photo to a temporary file for every thumbnail
+takes much longer than finding the crop itself. Instead, every process that
+creates thumbnails keeps a single node process running the bundled
+``smartcrop_worker.js`` script, and sends it a downscaled copy of the photo
+over a pipe. The worker only returns the crop box, the actual crop is done
+here.
+
+The ``smartcrop`` node module is loaded from the installation of
+``smartcrop-cli.js`` that ``smartcrop_js_path`` points to.
+
+Author: Gertjan van den Burg
+License: GPL v3.
+
+"""
+
+import atexit
+import base64
+import json
+import logging
+import os
+import subprocess
+
+from PIL import Image
+
+from .config import settings
+from .utils import scale_box
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), "smartcrop_worker.js")
+
+# SmartCrop.js analyses photos with the shortest side scaled to this size, so
+# sending a larger image to the worker doesn't change the result.
+ANALYSIS_SIZE = 256
+
+_worker = None
+
+
+class SmartCropJS(object):
+    def __init__(self, cli_path, node="node"):
+        self.cli_path = cli_path
+        self.node = node
+        self.pid = os.getpid()
+        self._proc = None
+
+    @property
+    def running(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self):
+        """Start the node process"""
+        cli_dir = os.path.dirname(os.path.realpath(self.cli_path))
+        paths = [
+            os.path.join(cli_dir, "node_modules"),
+            os.path.dirname(cli_dir),
+        ]
+        env = dict(os.environ)
+        if env.get("NODE_PATH"):
+            paths.append(env["NODE_PATH"])
+        env["NODE_PATH"] = os.pathsep.join(paths)
+        logging.info("Starting SmartCrop.js worker.")
+        self._proc = subprocess.Popen(
+            [self.node, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+        )
+
+    def close(self):
+        """Stop the node process"""
+        if self._proc is None:
+            return
+        self._proc.stdin.close()
+        self._proc.wait()
+        self._proc.stdout.close()
+        self._proc = None
+
+    def crop(self, image, width, height):
+        """Find the crop of the image for a thumbnail of the given size
+
+        Returns the crop box as a (left, upper, right, lower) tuple in the
+        coordinates of the image.
+        """
+        if not self.running:
+            self.start()
+
+        scale = min(1.0, ANALYSIS_SIZE / min(image.size))
+        proxy = image
+        if scale < 1.0:
+            size = (
+                max(1, round(scale * image.width)),
+                max(1, round(scale * image.height)),
+            )
+            proxy = image.resize(size, Image.Resampling.BILINEAR)
+        proxy = proxy.convert("RGBA")
+
+        request = {
+            "width": proxy.width,
+            "height": proxy.height,
+            "crop_width": width,
+            "crop_height": height,
+            "data": base64.b64encode(proxy.tobytes()).decode("ascii"),
+        }
+        self._proc.stdin.write(json.dumps(request).encode("utf-8") + b"\n")
+        self._proc.stdin.flush()
+        line = self._proc.stdout.readline()
+        if not line:
+            self._proc = None
+            raise RuntimeError("SmartCrop.js worker exited unexpectedly.")
+        crop = json.loads(line.decode("utf-8"))
+        if "error" in crop:
+            raise RuntimeError("SmartCrop.js failed: %s" % crop["error"])
+
+        box = (
+            crop["x"],
+            crop["y"],
+            crop["x"] + crop["width"],
+            crop["y"] + crop["height"],
+        )
+        return scale_box(box, proxy.size, image.size)
+
+
+def get_worker():
+    """Get the SmartCrop.js worker of this process"""
+    global _worker
+    # A worker inherited from the parent of a forked process shares its
+    # pipes, so it can't be used here.
+    if (
+        _worker is None
+        or _worker.pid != os.getpid()
+        or _worker.cli_path != settings.smartcrop_js_path
+    ):
+        if _worker is not None and _worker.pid == os.getpid():
+            _worker.close()
+        _worker = SmartCropJS(settings.smartcrop_js_path)
+    return _worker
+
+
+@atexit.register
+def close_worker():
+    """Stop the SmartCrop.js worker of this process, if any"""
+    global _worker
+    if _worker is not None and _worker.pid == os.getpid():
+        _worker.close()
+    _worker = None
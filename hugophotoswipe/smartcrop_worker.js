@@ -0,0 +1,89 @@
+/*
+ * Long-lived SmartCrop.js worker for HugoPhotoSwipe
+ *
+ * Reads one JSON request per line from stdin and writes one JSON response per
+ * line to stdout. A request contains the dimensions of the desired crop and
+ * an already downscaled RGBA image as base64, a response contains the crop
+ * box in the coordinates of that image.
+ *
+ * Author: Gertjan van den Burg
+ * License: GPL v3.
+ *
+ */
+
+"use strict";
+
+const readline = require("readline");
+const smartcrop = require("smartcrop");
+
+// The image is sent as raw pixels, so no decoding library is needed
+const imageOperations = {
+  open: function (image) {
+    return Promise.resolve(image);
+  },
+  resample: function (image, width, height) {
+    width = Math.max(1, Math.round(width));
+    height = Math.max(1, Math.round(height));
+    const data = new Uint8ClampedArray(width * height * 4);
+    for (let y = 0; y < height; y++) {
+      const sy = Math.floor((y * image.height) / height);
+      for (let x = 0; x < width; x++) {
+        const sx = Math.floor((x * image.width) / width);
+        const src = (sy * image.width + sx) * 4;
+        const dst = (y * width + x) * 4;
+        for (let c = 0; c < 4; c++) {
+          data[dst + c] = image.data[src + c];
+        }
+      }
+    }
+    return { width: width, height: height, data: data };
+  },
+  getData: function (image) {
+    return Promise.resolve(image);
+  },
+};
+
+function handle(line) {
+  const request = JSON.parse(line);
+  const buffer = Buffer.from(request.data, "base64");
+  const image = {
+    width: request.width,
+    height: request.height,
+    data: new Uint8ClampedArray(
+      buffer.buffer,
+      buffer.byteOffset,
+      buffer.length
+    ),
+  };
+  const options = {
+    width: request.crop_width,
+    height: request.crop_height,
+    prescale: false,
+    imageOperations: imageOperations,
+  };
+  return smartcrop.crop(image, options).then(function (result) {
+    const crop = result.topCrop;
+    return { x: crop.x, y: crop.y, width: crop.width, height: crop.height };
+  });
+}
+
+// Requests are answered one at a time and in order
+let queue = Promise.resolve();
+const rl = readline.createInterface({ input: process.stdin });
+rl.on("line", function (line) {
+  queue = queue
+    .then(function () {
+      return handle(line);
+    })
+    .catch(function (err) {
+      return { error: String(err) };
+    })
+    .then(function (response) {
+      process.stdout.write(JSON.stringify(response) + "\n");
+    });
+});
+rl.on("close", function () {
+  queue.then(function () {
+    process.exit(0);
+  });
+});
@@ -5,6 +5,9 @@
 This file contains the functions for handling the command line user interface.
 It mainly processses the command line arguments, loads the settings,
 initializes a HugoPhotoSwipe instance, and passes the command to this instance.
+Commands are sent to the daemon instead if one is running. The rest of the
+package is only imported when a command needs it, so that ``hps --version``
+and ``hps init`` start quickly.
 
 Author: Gertjan van den Burg
 License: GPL v3.
@@ -18,13 +21,21 @@ import sys
 
 from . import __version__
 from .config import SETTINGS_FILENAME
+from .config import load_settings
 from .config import settings
-from .hugophotoswipe import HugoPhotoSwipe
 
 
 def main():
     """Main HugoPhotoSwipe function to be called to run the program"""
-    command, album = parse_args()
+    args = parse_args()
+    command, album = args.command, args.album
+
+    load_settings()
+    settings.verbose = args.loglevel == logging.INFO
+    settings.fast = args.fast
+    settings.jobs = args.jobs
+    settings.verify_hashes = args.verify
+    settings.poll = args.poll
 
     if command == "init":
         logging.info("Dumping settings file.")
@@ -39,9 +50,24 @@ def main():
         )
         raise SystemExit(1)
 
+    # Let the daemon run the command if it is running
+    if command in ["update", "clean", "status", "stop"]:
+        from .daemon import request
+
+        code = request(command, album=album)
+        if code:
+            raise SystemExit(code)
+        if code is not None:
+            return
+        if command in ["status", "stop"]:
+            print("No daemon is running.")
+            return
+
     if not settings.validate():
         return
 
+    from .hugophotoswipe import HugoPhotoSwipe
+
     hps = HugoPhotoSwipe()
     if command == "new":
         logging.info("Creating new album")
@@ -52,6 +78,14 @@ def main():
     elif command == "clean":
         logging.info("Running clean")
         hps.clean(name=album)
+    elif command == "watch":
+        logging.info("Watching albums")
+        hps.watch(name=album)
+    elif command == "daemon":
+        from .daemon import Daemon
+
+        logging.info("Starting daemon")
+        Daemon().serve()
     else:
         raise ValueError("Unknown command: %s" % command)
     logging.info("Dumping settings file.")
@@ -78,6 +112,23 @@ def parse_args():
         action="store_true",
         help=("Fast mode (attempts fewer potential crops for thumbnails)"),
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes to use for creating the resized images",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Recompute the checksums of all photos instead of using cache",
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="Watch for changes by polling instead of with inotify",
+    )
     parser.add_argument(
         "-V",
         "--version",
@@ -86,7 +137,16 @@ def parse_args():
     )
     parser.add_argument(
         "command",
-        choices=["new", "update", "clean", "init"],
+        choices=[
+            "new",
+            "update",
+            "clean",
+            "watch",
+            "daemon",
+            "status",
+            "stop",
+            "init",
+        ],
         help="action to do",
     )
     parser.add_argument(
@@ -98,9 +158,7 @@ def parse_args():
         datefmt="[%Y-%m-%d %H:%M:%S]",
         format="%(asctime)s - %(message)s",
     )
-    settings.verbose = args.loglevel == logging.INFO
-    settings.fast = args.fast
-    return args.command, args.album
+    return args
 
 
 if __name__ == "__main__":
@@ -9,6 +9,8 @@ License: GPL v3.
 
 """
 
+import os
+
 from datetime import datetime
 from datetime import timezone
 
@@ -20,6 +22,65 @@ def modtime():
     return nowstr
 
 
+def stat_signature(path):
+    """Signature of a file that changes when the file is modified"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def scale_box(box, from_size, to_size):
+    """Map a crop box from an image of one size to one of another size"""
+    sx = to_size[0] / from_size[0]
+    sy = to_size[1] / from_size[1]
+    left, upper, right, lower = box
+    return (
+        int(round(left * sx)),
+        int(round(upper * sy)),
+        min(to_size[0], int(round(right * sx))),
+        min(to_size[1], int(round(lower * sy))),
+    )
+
+
+def read_file(filename):
+    """Read the contents of a text file, or None if it doesn't exist"""
+    if not os.path.exists(filename):
+        return None
+    with open(filename, "r") as fp:
+        return fp.read()
+
+
+def yaml_loader():
+    """The safe YAML loader class, backed by libyaml when available
+
+    The loader backed by libyaml is much faster than the one in pure Python,
+    but it is only available if PyYAML was built with it.
+    """
+    import yaml
+
+    return getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def load_yaml(stream):
+    """Load YAML like ``yaml.safe_load``, with libyaml when available"""
+    import yaml
+
+    return yaml.load(stream, Loader=yaml_loader())
+
+
+def write_if_changed(filename, content):
+    """Write a text file, unless it exists with the same contents
+
+    Returns True if the file was written. Leaving an unchanged file alone
+    keeps its modification time, which avoids needless rebuilds and uploads
+    of the site.
+    """
+    if read_file(filename) == content:
+        return False
+    with open(filename, "w") as fp:
+        fp.write(content)
+    return True
+
+
 def yaml_field_to_file(fp, data, field, indent="", force_string=False):
     """Handy function for writing pretty yaml"""
     if data is None:
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+
+"""Watch the albums and update them when their photos change
+
+The AlbumWatcher class keeps the albums in memory and waits for changes to
+the photo directories and album files. Changes that arrive shortly after each
+other are collected in a single burst, after which only the photos that have
+changed are processed and the markdown and album file of every affected album
+are written once.
+
+Changes are detected with inotify on Linux, through ctypes, and by
+periodically listing the watched directories elsewhere or when polling is
+requested with the ``--poll`` flag. Both monitors watch individual
+directories, not the trees below them.
+
+Author: Gertjan van den Burg
+License: GPL v3.
+
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+from .config import settings
+from .utils import stat_signature
+
+# Seconds without changes after which a burst of changes is processed
+DEBOUNCE = 1.0
+
+# Seconds between two listings of the watched directories when polling
+POLL_INTERVAL = 2.0
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+# Files are reported when they are closed after writing, not when they are
+# created, so that photos that are being copied aren't read too early.
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+_MISSING = object()
+
+
+class InotifyMonitor(object):
+    """Report changes in directories using the inotify API of Linux"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._paths = {}
+        self._wds = {}
+
+    def add(self, path):
+        """Watch a directory, returns False if it is watched already"""
+        if path in self._wds:
+            return False
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(path), WATCH_MASK
+        )
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        self._paths[wd] = path
+        self._wds[path] = wd
+        return True
+
+    def read(self, timeout=None):
+        """Wait for changes and return the paths that have changed
+
+        Returns an empty list if nothing changes within ``timeout`` seconds.
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except OSError as err:
+            if err.errno == errno.EINTR:
+                return []
+            raise
+
+        changed = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # events were lost, so everything may have changed
+                changed.extend(self._wds)
+                continue
+            path = self._paths.get(wd)
+            if path is None:
+                continue
+            if mask & IN_IGNORED:
+                del self._paths[wd]
+                del self._wds[path]
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                changed.append(path)
+                continue
+            if mask & IN_CREATE and not mask & IN_ISDIR:
+                continue
+            changed.append(os.path.join(path, name))
+        return changed
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = None
+
+
+class PollingMonitor(object):
+    """Report changes in directories by listing them periodically"""
+
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        self._snapshots = {}
+
+    def add(self, path):
+        """Watch a directory, returns False if it is watched already"""
+        if path in self._snapshots:
+            return False
+        snapshot = self._snapshot(path)
+        if snapshot is None:
+            raise FileNotFoundError(
+                errno.ENOENT, os.strerror(errno.ENOENT), path
+            )
+        self._snapshots[path] = snapshot
+        return True
+
+    def read(self, timeout=None):
+        """Wait for changes and return the paths that have changed
+
+        Returns an empty list if nothing changes within ``timeout`` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self._poll()
+            if changed:
+                return changed
+            wait = self.interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return []
+            time.sleep(wait)
+
+    def close(self):
+        self._snapshots = {}
+
+    def _poll(self):
+        changed = []
+        for path, old in list(self._snapshots.items()):
+            new = self._snapshot(path)
+            if new is None:
+                del self._snapshots[path]
+                changed.append(path)
+                continue
+            for name in set(old) | set(new):
+                if not old.get(name, _MISSING) == new.get(name, _MISSING):
+                    changed.append(os.path.join(path, name))
+            self._snapshots[path] = new
+        return changed
+
+    def _snapshot(self, path):
+        """Signatures of the files in a directory, or None if it's gone
+
+        Subdirectories are only reported when they appear or disappear, like
+        with inotify.
+        """
+        snapshot = {}
+        try:
+            entries = os.scandir(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        snapshot[entry.name] = None
+                    else:
+                        snapshot[entry.name] = stat_signature(entry.path)
+                except FileNotFoundError:
+                    continue
+        return snapshot
+
+
+def get_monitor(poll=False):
+    """Get the monitor for this platform, or a polling monitor if asked"""
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return InotifyMonitor()
+        except (OSError, AttributeError) as err:
+            logging.warning(
+                "Can't use inotify, polling for changes instead: %s" % err
+            )
+    return PollingMonitor()
+
+
+class AlbumWatcher(object):
+    def __init__(self, hps, monitor, name=None, debounce=DEBOUNCE):
+        self.hps = hps
+        self.monitor = monitor
+        self.name = name
+        self.debounce = debounce
+
+        # the albums are kept in memory between updates
+        self._albums = {}
+
+        # signatures of the album files after they were last written here,
+        # so that these writes aren't taken as changes
+        self._written = {}
+
+    def run(self):
+        """Update the albums, and then again whenever they change"""
+        try:
+            self.start()
+            print("Watching for changes. Press Ctrl+C to stop.")
+            while True:
+                self.process(self.wait())
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+        finally:
+            self.monitor.close()
+
+    def start(self):
+        """Start watching and bring the albums up to date"""
+        if self.name is None:
+            # new albums are added to the current directory
+            self.monitor.add(".")
+            album_dirs = self.hps._album_dirs
+        else:
+            album_dirs = [self.name]
+        for album_dir in album_dirs:
+            self._update(album_dir)
+
+    def wait(self):
+        """Wait for a burst of changes and return the changed paths
+
+        The burst ends when nothing has changed for ``debounce`` seconds.
+        """
+        paths = set(self.monitor.read())
+        while True:
+            more = self.monitor.read(timeout=self.debounce)
+            if not more:
+                return paths
+            paths.update(more)
+
+    def process(self, paths):
+        """Update the albums in which the given paths have changed"""
+        # for every album the names of the changed photos, or None if it
+        # has to be checked completely
+        changes = {}
+        reload = set()
+        for path in paths:
+            parts = os.path.normpath(path).split(os.sep)
+            album_dir = parts[0]
+            if album_dir in [os.curdir, os.pardir]:
+                continue
+            if self.name is not None and not album_dir == self.name:
+                continue
+            if parts[1:] == [settings.album_file]:
+                if self._is_own_write(album_dir):
+                    continue
+                reload.add(album_dir)
+                changes[album_dir] = None
+            elif len(parts) == 3 and parts[1] == settings.photo_dir:
+                if changes.get(album_dir, set()) is not None:
+                    changes.setdefault(album_dir, set()).add(parts[2])
+            elif len(parts) == 1 or parts[1:] == [settings.photo_dir]:
+                # directories that were added or removed
+                changes[album_dir] = None
+
+        for album_dir, filenames in sorted(
+            changes.items(), key=lambda item: item[0]
+        ):
+            self._update(
+                album_dir, filenames=filenames, reload=album_dir in reload
+            )
+
+    def _update(self, album_dir, filenames=None, reload=False):
+        """Update an album, loading it if needed"""
+        if not os.path.isdir(album_dir):
+            self._albums.pop(album_dir, None)
+            return
+
+        # directories without album file are watched, as it may be added
+        self.monitor.add(album_dir)
+        album_file = os.path.join(album_dir, settings.album_file)
+        if not os.path.exists(album_file):
+            self._albums.pop(album_dir, None)
+            return
+
+        album = self._albums.get(album_dir)
+        if album is None or reload:
+            album = self.hps._load_album(album_dir)
+            if album is None:
+                return
+            self._albums[album_dir] = album
+            filenames = None
+
+        photo_dir = os.path.join(album_dir, settings.photo_dir)
+        if not os.path.isdir(photo_dir):
+            return
+        if self.monitor.add(photo_dir):
+            # photos may have been added before the directory was watched
+            filenames = None
+
+        print("Updating album: %s" % album.name)
+        try:
+            album.update(filenames=filenames)
+        except Exception as err:
+            # the album is loaded again on the next change
+            logging.error(
+                "[%s] Failed to update album: %s" % (album.name, err)
+            )
+            self._albums.pop(album_dir, None)
+            return
+        if os.path.exists(album_file):
+            self._written[album_file] = stat_signature(album_file)
+
+    def _is_own_write(self, album_dir):
+        album_file = os.path.join(album_dir, settings.album_file)
+        if not os.path.exists(album_file):
+            return False
+        return self._written.get(album_file) == stat_signature(album_file)
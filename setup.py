@@ -27,7 +27,9 @@ REQUIRED = [
     "pytz",
     "pyyaml",
     "tqdm",
-    "smartcrop",
+    "smartcrop>=0.5",
+    "numpy>=1.20",
+    "Pillow>=9.1",
 ]
 
 docs_require = []
@@ -79,6 +81,7 @@ setup(
     packages=find_packages(
         exclude=["tests", "*.tests", "*.tests.*", "tests.*"]
     ),
+    package_data={"hugophotoswipe": ["smartcrop_worker.js"]},
     install_requires=REQUIRED,
     extras_require=EXTRAS,
     include_package_data=True,
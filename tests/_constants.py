@@ -60,7 +60,7 @@ cover = "/hpstest/photos/dogs/coverimage.jpg"
 +++
 
 {{< wrap >}}
-{{< photo href="/hpstest/photos/dogs/large/dog_1_1600x1066.jpg" largeDim="1600x1066" smallUrl="/hpstest/photos/dogs/small/dog_1_800x533.jpg" smallDim="800x533" alt="" thumbSize="256x256" thumbUrl="/hpstest/photos/dogs/thumb/dog_1_256x256.jpg" caption="Hello" copyright="copy" >}}
+{{< photo href="/hpstest/photos/dogs/large/dog_1_1600x1068.jpg" largeDim="1600x1068" smallUrl="/hpstest/photos/dogs/small/dog_1_800x534.jpg" smallDim="800x534" alt="" thumbSize="256x256" thumbUrl="/hpstest/photos/dogs/thumb/dog_1_256x256.jpg" caption="Hello" copyright="copy" >}}
 
 {{< photo href="/hpstest/photos/dogs/large/dog_2_1600x1067.jpg" largeDim="1600x1067" smallUrl="/hpstest/photos/dogs/small/dog_2_800x533.jpg" smallDim="800x533" alt="" thumbSize="256x256" thumbUrl="/hpstest/photos/dogs/thumb/dog_2_256x256.jpg" caption="yes this is dog" copyright="copy" >}}
 
@@ -101,12 +101,21 @@ photos:
 hashes:
 - file: dog-1.jpg
   hash: sha256:c2fdf14c548a08032fd06e6036197fc7e9c262e6d06fac40e54ec5dd2ce6912f
+  width: 2144
+  height: 1429
+  orientation: 1
 
 - file: dog-2.jpg
   hash: sha256:b09c4ddbbcf053d521539a8a498f7b745313561371dcbb9500687951f2dc7b4e
+  width: 2736
+  height: 1824
+  orientation: 1
 
 - file: dog-3.jpg
   hash: sha256:bc6c7fb353d01edfbcd2f707e202d3d31150fdc3faf6f9580c36cb2e0e2a0b81
+  width: 2000
+  height: 1300
+  orientation: 1
 """
 
 TEST_ALBUM_YAML_2 = """\
@@ -135,9 +144,15 @@ photos:
 hashes:
 - file: dog-1.jpg
   hash: sha256:c2fdf14c548a08032fd06e6036197fc7e9c262e6d06fac40e54ec5dd2ce6912f
+  width: 2144
+  height: 1429
+  orientation: 1
 
 - file: dog-2.jpg
   hash: sha256:b09c4ddbbcf053d521539a8a498f7b745313561371dcbb9500687951f2dc7b4e
+  width: 2736
+  height: 1824
+  orientation: 1
 """
 
 TEST_ALBUM_YAML_3 = """\
@@ -176,15 +191,27 @@ photos:
 hashes:
 - file: dog-1.jpg
   hash: sha256:c2fdf14c548a08032fd06e6036197fc7e9c262e6d06fac40e54ec5dd2ce6912f
+  width: 2144
+  height: 1429
+  orientation: 1
 
 - file: dog-2.jpg
   hash: sha256:b09c4ddbbcf053d521539a8a498f7b745313561371dcbb9500687951f2dc7b4e
+  width: 2736
+  height: 1824
+  orientation: 1
 
 - file: dog-3.jpg
   hash: sha256:bc6c7fb353d01edfbcd2f707e202d3d31150fdc3faf6f9580c36cb2e0e2a0b81
+  width: 2000
+  height: 1300
+  orientation: 1
 
 - file: cat-1.jpg
   hash: sha256:628569ade5866f91a765409a37b602e3a87f09ddb3fd3bb7a0b1dfbeb4362669
+  width: 2120
+  height: 1415
+  orientation: 1
 """
 
 TEST_ALBUM_YAML_4 = """\
@@ -218,10 +245,19 @@ photos:
 hashes:
 - file: dog-1.jpg
   hash: sha256:628569ade5866f91a765409a37b602e3a87f09ddb3fd3bb7a0b1dfbeb4362669
+  width: 2120
+  height: 1415
+  orientation: 1
 
 - file: dog-2.jpg
   hash: sha256:b09c4ddbbcf053d521539a8a498f7b745313561371dcbb9500687951f2dc7b4e
+  width: 2736
+  height: 1824
+  orientation: 1
 
 - file: dog-3.jpg
   hash: sha256:bc6c7fb353d01edfbcd2f707e202d3d31150fdc3faf6f9580c36cb2e0e2a0b81
+  width: 2000
+  height: 1300
+  orientation: 1
 """
@@ -3,11 +3,14 @@ Unit tests for the Album class
 
 """
 
+import builtins
 import os
 import shutil
 import tempfile
 import unittest
 
+from unittest import mock
+
 from _constants import TEST_ALBUM_MARKDOWN_1
 from _constants import TEST_ALBUM_MARKDOWN_2
 from _constants import TEST_ALBUM_MARKDOWN_3
@@ -267,6 +270,20 @@ class AlbumTestCase(unittest.TestCase):
                 self.assertTrue(os.path.exists(filename))
         self.assertTrue(os.path.exists(cover))
 
+    def test_markdown_without_images(self):
+        self._make_test_album(self._album_dir)
+        album = Album.load(self._album_dir)
+        album.update(modification_time="2021-03-20T16:41:06+00:00")
+
+        # the dimensions are loaded from the album file
+        album = Album.load(self._album_dir)
+        with mock.patch.object(
+            Photo, "_load_original_image", side_effect=AssertionError
+        ):
+            album.create_markdown()
+        with open(album.markdown_file, "r") as fp:
+            self.assertEqual(fp.read(), TEST_ALBUM_MARKDOWN_1)
+
     def test_update_4(self):
         self._make_test_album(self._album_dir)
         album = Album.load(self._album_dir)
@@ -287,12 +304,12 @@ class AlbumTestCase(unittest.TestCase):
         cover = os.path.join(album_out, "coverimage.jpg")
         resized_files = {
             "large": [
-                "dog_1_1600x1066.jpg",
+                "dog_1_1600x1068.jpg",
                 "dog_2_1600x1067.jpg",
                 "dog-3_1600x1040.jpg",
             ],
             "small": [
-                "dog_1_800x533.jpg",
+                "dog_1_800x534.jpg",
                 "dog_2_800x533.jpg",
                 "dog-3_800x520.jpg",
             ],
@@ -307,3 +324,309 @@ class AlbumTestCase(unittest.TestCase):
                 filename = os.path.join(album_out, size, file)
                 self.assertTrue(os.path.exists(filename))
         self.assertTrue(os.path.exists(cover))
+
+    def test_update_jobs(self):
+        self._make_test_album(self._album_dir)
+        album = Album.load(self._album_dir)
+        album.update(modification_time="2021-03-20T16:41:06+00:00")
+
+        album_out = os.path.join(self._output_dir, "dogs")
+        serial = {}
+        for root, _, files in os.walk(album_out):
+            for f in files:
+                with open(os.path.join(root, f), "rb") as fp:
+                    serial[os.path.join(root, f)] = fp.read()
+        album.clean(force=True)
+
+        setattr(settings, "jobs", 2)
+        album = Album.load(self._album_dir)
+        album.update(modification_time="2021-03-20T16:41:06+00:00")
+
+        with open(album.markdown_file, "r") as fp:
+            self.assertEqual(fp.read(), TEST_ALBUM_MARKDOWN_1)
+        with open(album._album_file, "r") as fp:
+            self.assertEqual(fp.read(), TEST_ALBUM_YAML_1)
+
+        parallel = {}
+        for root, _, files in os.walk(album_out):
+            for f in files:
+                with open(os.path.join(root, f), "rb") as fp:
+                    parallel[os.path.join(root, f)] = fp.read()
+        self.assertEqual(len(serial), 10)
+        self.assertEqual(serial, parallel)
+
+    def _count_reads(self, album, **kwargs):
+        """Count how often each original photo is opened during update"""
+        paths = [
+            os.path.join(self._album_dir, "photos", f"dog-{i}.jpg")
+            for i in range(1, 4)
+        ]
+        real_open = builtins.open
+        with mock.patch("builtins.open", side_effect=real_open) as mock_open:
+            album.update(**kwargs)
+        opened = [c.args[0] for c in mock_open.call_args_list if c.args]
+        return [opened.count(pth) for pth in paths]
+
+    def test_update_file_reads(self):
+        self._make_test_album(self._album_dir)
+        setattr(settings, "verify_hashes", True)
+        album = Album.load(self._album_dir)
+
+        # hashing and decoding from the same mapping of the file
+        reads = self._count_reads(album)
+        self.assertEqual(reads, [1, 1, 1])
+
+        # only hashing, as the dimensions are stored in the album file and
+        # the hash computed during update is reused when dumping
+        album = Album.load(self._album_dir)
+        reads = self._count_reads(album)
+        self.assertEqual(reads, [1, 1, 1])
+
+        # without verification the hash cache is used
+        setattr(settings, "verify_hashes", False)
+        album = Album.load(self._album_dir)
+        reads = self._count_reads(album)
+        self.assertEqual(reads, [0, 0, 0])
+
+    def _update_saved(self, album):
+        """Update the album and return the names of the saved images"""
+        with mock.patch.object(
+            Photo, "_save", autospec=True, side_effect=Photo._save
+        ) as save:
+            album.update(modification_time="2021-03-20T16:41:06+00:00")
+        return sorted(os.path.basename(c.args[2]) for c in save.call_args_list)
+
+    def test_update_manifest(self):
+        self._make_test_album(self._album_dir)
+        album = Album.load(self._album_dir)
+        self.assertEqual(len(self._update_saved(album)), 10)
+
+        # nothing changed, nothing to do
+        album = Album.load(self._album_dir)
+        self.assertEqual(self._update_saved(album), [])
+
+        # only the thumbnails depend on the thumbnail dimensions
+        setattr(settings, "dim_max_thumb", "200x200")
+        album = Album.load(self._album_dir)
+        self.assertEqual(
+            self._update_saved(album),
+            ["dog-3_200x200.jpg", "dog_1_200x200.jpg", "dog_2_200x200.jpg"],
+        )
+
+        # all sizes depend on the jpeg quality
+        setattr(settings, "jpeg_quality", 80)
+        album = Album.load(self._album_dir)
+        self.assertEqual(len(self._update_saved(album)), 10)
+
+        # adding a format recreates the sizes, now also in that format
+        setattr(settings, "extra_formats", ["webp"])
+        album = Album.load(self._album_dir)
+        self.assertEqual(len(self._update_saved(album)), 10)
+        for photo in album.photos:
+            for pth in photo.rendition_paths("large").values():
+                self.assertTrue(os.path.exists(pth))
+        album = Album.load(self._album_dir)
+        self.assertEqual(self._update_saved(album), [])
+        setattr(settings, "extra_formats", [])
+
+        # the steps of the width ladder are added to the existing sizes
+        setattr(settings, "dim_ladder", [320, 640])
+        album = Album.load(self._album_dir)
+        saved = self._update_saved(album)
+        self.assertEqual(len(saved), 6)
+        self.assertIn("dog_1_320x213.jpg", saved)
+        album = Album.load(self._album_dir)
+        self.assertEqual(self._update_saved(album), [])
+        setattr(settings, "dim_ladder", [])
+
+        # after cleaning, everything is created again
+        album.clean(force=True)
+        album = Album.load(self._album_dir)
+        self.assertEqual(len(self._update_saved(album)), 10)
+
+    def test_update_adopt_sizes(self):
+        self._make_test_album(self._album_dir)
+        album = Album.load(self._album_dir)
+        album.update(modification_time="2021-03-20T16:41:06+00:00")
+
+        # existing sizes are adopted when the manifest is missing
+        os.unlink(os.path.join(self._album_dir, settings.cache_file))
+        album = Album.load(self._album_dir)
+        self.assertEqual(self._update_saved(album), [])
+
+    def test_update_switch_cover(self):
+        self._make_test_album(self._album_dir)
+        album = Album.load(self._album_dir)
+        album.update(modification_time="2021-03-20T16:41:06+00:00")
+
+        # the cover is rendered again from the new cover photo, also when
+        # switching back to a photo that was the cover before
+        for coverimage in ["dog-2.jpg", "dog-1.jpg"]:
+            album = Album.load(self._album_dir)
+            album.coverimage = coverimage
+            self.assertEqual(
+                self._update_saved(album), [settings.cover_filename]
+            )
+            for photo in album.photos:
+                is_cover = photo.filename == coverimage
+                self.assertEqual("cover" in photo.renditions, is_cover)
+
+            photo = next(p for p in album.photos if p.filename == coverimage)
+            pth = os.path.join(self._tmpdir, "expected.jpg")
+            photo.create_thumb(mode="cover", pth=pth)
+            with open(album.cover_path, "rb") as fp, open(pth, "rb") as exp:
+                self.assertEqual(fp.read(), exp.read())
+
+    def test_update_missing_sizes(self):
+        self._make_test_album(self._album_dir)
+        album = Album.load(self._album_dir)
+        album.update(modification_time="2021-03-20T16:41:06+00:00")
+
+        # sizes that are in the manifest but not on disk are created again
+        shutil.rmtree(os.path.join(self._output_dir, "dogs", "thumb"))
+        album = Album.load(self._album_dir)
+        self.assertEqual(
+            self._update_saved(album),
+            ["dog-3_256x256.jpg", "dog_1_256x256.jpg", "dog_2_256x256.jpg"],
+        )
+        for photo in album.photos:
+            self.assertTrue(os.path.exists(photo.thumb_path))
+
+    def test_update_output_listing(self):
+        self._make_test_album(self._album_dir)
+        album = Album.load(self._album_dir)
+        album.update(modification_time="2021-03-20T16:41:06+00:00")
+
+        # the sizes are adopted from a single listing of the output dirs
+        album = Album.load(self._album_dir)
+        album.cache.renditions = {}
+        with mock.patch(
+            "os.path.exists", side_effect=os.path.exists
+        ) as exists, mock.patch(
+            "os.makedirs", side_effect=os.makedirs
+        ) as makedirs:
+            self.assertEqual(album.prepare_update(), [])
+        checked = [c.args[0] for c in exists.call_args_list]
+        self.assertFalse(any(p.endswith(".jpg") for p in checked))
+        self.assertEqual(makedirs.call_count, 4)
+        for photo in album.photos:
+            self.assertEqual(len(photo.renditions), len(photo.size_modes()))
+
+    def _count_crops(self, album):
+        """Update the album and return the number of crop searches"""
+        with mock.patch.object(
+            Photo,
+            "_find_crop_py",
+            autospec=True,
+            side_effect=Photo._find_crop_py,
+        ) as find_crop:
+            album.update(modification_time="2021-03-20T16:41:06+00:00")
+        return find_crop.call_count
+
+    def test_update_crops(self):
+        self._make_test_album(self._album_dir)
+        album = Album.load(self._album_dir)
+        self.assertEqual(self._count_crops(album), 3)
+
+        # the crop boxes are reused for thumbnails of the same aspect ratio
+        setattr(settings, "dim_max_thumb", "200x200")
+        album = Album.load(self._album_dir)
+        self.assertEqual(self._count_crops(album), 0)
+
+        # and survive cleaning the album
+        album.clean(force=True)
+        album = Album.load(self._album_dir)
+        self.assertEqual(self._count_crops(album), 0)
+
+        # but not a change in aspect ratio
+        setattr(settings, "dim_max_thumb", "200x100")
+        album = Album.load(self._album_dir)
+        self.assertEqual(self._count_crops(album), 3)
+
+    def test_update_unchanged_files(self):
+        self._make_test_album(self._album_dir)
+        album = Album.load(self._album_dir)
+        album.update(modification_time="2021-03-20T16:41:06+00:00")
+
+        album_file = os.path.join(self._album_dir, settings.album_file)
+        os.unlink(album_file + ".bak")
+        files = [album.markdown_file, album_file]
+        before = [os.stat(f).st_mtime_ns for f in files]
+        contents = [open(f, "r").read() for f in files]
+
+        # only the modification time would change, so nothing is written
+        album = Album.load(self._album_dir)
+        album.update(modification_time="2022-01-01T00:00:00+00:00")
+        self.assertEqual([os.stat(f).st_mtime_ns for f in files], before)
+        self.assertEqual([open(f, "r").read() for f in files], contents)
+        self.assertFalse(os.path.exists(album_file + ".bak"))
+
+        # a changed caption updates both files and the modification time
+        album = Album.load(self._album_dir)
+        album.photos[0].caption = "A new caption"
+        album.update(modification_time="2022-01-01T00:00:00+00:00")
+        self.assertTrue(os.path.exists(album_file + ".bak"))
+        with open(album_file, "r") as fp:
+            self.assertIn("2022-01-01T00:00:00+00:00", fp.read())
+        with open(album.markdown_file, "r") as fp:
+            self.assertIn("A new caption", fp.read())
+
+    def test_prepare_update_sync(self):
+        self._make_test_album(self._album_dir)
+        photos_dir = os.path.join(self._album_dir, "photos")
+        os.unlink(os.path.join(photos_dir, "dog-2.jpg"))
+        for f in ["dog-5.jpg", "dog-4.jpg"]:
+            shutil.copy(
+                os.path.join(photos_dir, "dog-1.jpg"),
+                os.path.join(photos_dir, f),
+            )
+
+        album = Album.load(self._album_dir)
+        album.hashes = [
+            {"file": "dog-3.jpg", "hash": "sha256:abc"},
+            {"file": "dog-2.jpg", "hash": "sha256:def"},
+        ]
+        to_process = album.prepare_update()
+
+        # deleted photos are removed and new ones added in sorted order
+        filenames = ["dog-1.jpg", "dog-3.jpg", "dog-4.jpg", "dog-5.jpg"]
+        self.assertEqual([p.filename for p in album.photos], filenames)
+        self.assertEqual([p.filename for p in to_process], filenames)
+        self.assertEqual(
+            [p.previous_sha256 for p in album.photos],
+            [None, "abc", None, None],
+        )
+        self.assertEqual(album.photos[0].cover_path, album.cover_path)
+
+    def test_update_placeholder(self):
+        self._make_test_album(self._album_dir)
+        album = Album.load(self._album_dir)
+        album.update(modification_time="2021-03-20T16:41:06+00:00")
+
+        # enabling placeholders computes them without creating sizes
+        setattr(settings, "placeholder", "blurhash")
+        album = Album.load(self._album_dir)
+        self.assertEqual(self._update_saved(album), [])
+        album = Album.load(self._album_dir)
+        for photo in album.photos:
+            self.assertTrue(photo.color.startswith("#"))
+            self.assertEqual(len(photo.blurhash), 28)
+            self.assertIsNone(photo.preview)
+
+        # the markdown is created from the album file alone
+        with mock.patch("PIL.Image.open", side_effect=AssertionError):
+            album.create_markdown()
+        with open(album.markdown_file, "r") as fp:
+            markdown = fp.read()
+        for photo in album.photos:
+            self.assertIn('blurhash="%s"' % photo.blurhash, markdown)
+            self.assertIn('color="%s"' % photo.color, markdown)
+
+        # switching to the preview only adds the preview
+        setattr(settings, "placeholder", "preview")
+        album = Album.load(self._album_dir)
+        album.update(modification_time="2021-03-20T16:41:06+00:00")
+        album = Album.load(self._album_dir)
+        for photo in album.photos:
+            self.assertTrue(photo.preview.startswith("data:image/webp"))
+            self.assertIsNotNone(photo.blurhash)
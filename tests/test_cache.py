@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest import mock
+
+from hugophotoswipe.cache import AlbumCache
+from hugophotoswipe.config import settings
+from hugophotoswipe.photo import Photo
+
+
+class AlbumCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        here = os.path.dirname(os.path.realpath(__file__))
+        self._tmpdir = tempfile.mkdtemp(prefix="hps_cache_")
+        self._photo_file = os.path.join(self._tmpdir, "dog-1.jpg")
+        shutil.copy(
+            os.path.join(here, "data", "dogs", "dog-1.jpg"), self._photo_file
+        )
+        self.photo = Photo(
+            album_name="test_album", original_path=self._photo_file
+        )
+        settings.__init__(**dict())
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpdir)
+
+    def _count_hashes(self, cache, photo):
+        with mock.patch.object(
+            Photo, "sha256sum", autospec=True, side_effect=Photo.sha256sum
+        ) as sha:
+            digest = cache.sha256sum(photo)
+        return digest, sha.call_count
+
+    def test_sha256sum(self):
+        cache = AlbumCache.load(self._tmpdir)
+        exp = (
+            "c2fdf14c548a08032fd06e6036197fc7e9c262e6d06fac40e54ec5dd2ce6912f"
+        )
+
+        digest, count = self._count_hashes(cache, self.photo)
+        self.assertEqual(digest, exp)
+        self.assertEqual(count, 1)
+
+        # unchanged file isn't read again, also not after reloading
+        cache.dump()
+        cache = AlbumCache.load(self._tmpdir)
+        digest, count = self._count_hashes(cache, self.photo)
+        self.assertEqual(digest, exp)
+        self.assertEqual(count, 0)
+
+        # a different modification time means we recompute
+        stat = os.stat(self._photo_file)
+        os.utime(self._photo_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        digest, count = self._count_hashes(cache, self.photo)
+        self.assertEqual(digest, exp)
+        self.assertEqual(count, 1)
+
+    def test_sha256sum_unmapped(self):
+        # hashing for the album file doesn't keep the file mapped
+        cache = AlbumCache.load(self._tmpdir)
+        cache.sha256sum(self.photo)
+        self.assertIsNone(self.photo._original_data)
+
+        # but a photo that is being decoded keeps its mapping
+        photo = Photo(album_name="test_album", original_path=self._photo_file)
+        photo.original_image
+        cache = AlbumCache.load(self._tmpdir)
+        cache.sha256sum(photo)
+        self.assertIsNotNone(photo._original_data)
+        photo.free()
+
+    def test_verify_hashes(self):
+        cache = AlbumCache.load(self._tmpdir)
+        cache.sha256sum(self.photo)
+
+        setattr(settings, "verify_hashes", True)
+        _, count = self._count_hashes(cache, self.photo)
+        self.assertEqual(count, 1)
+
+    def test_prune(self):
+        cache = AlbumCache.load(self._tmpdir)
+        cache.sha256sum(self.photo)
+        cache.prune(["dog-1.jpg"])
+        self.assertEqual(list(cache.hashes), ["dog-1.jpg"])
+        cache.crops["dog-2.jpg"] = {"abc:1:1:smartcrop.py": [0, 0, 10, 10]}
+        cache.prune([])
+        self.assertEqual(cache.hashes, {})
+        self.assertEqual(cache.crops, {})
+
+    def test_corrupt(self):
+        with open(os.path.join(self._tmpdir, settings.cache_file), "w") as fp:
+            fp.write("{not json")
+        with self.assertLogs(level="WARNING"):
+            cache = AlbumCache.load(self._tmpdir)
+        self.assertEqual(cache.hashes, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
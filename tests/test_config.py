@@ -5,6 +5,7 @@ import tempfile
 import unittest
 
 from hugophotoswipe.config import Settings
+from hugophotoswipe.config import can_save
 from hugophotoswipe.config import load_settings
 
 
@@ -26,14 +27,22 @@ class ConfigTestCase(unittest.TestCase):
         with open(self._tempfile, "r") as fp:
             self.assertEqual(line(fp), "---")
             self.assertEqual(line(fp), "album_file: album.yml")
+            self.assertEqual(line(fp), "cache_file: .hps_cache.json")
+            self.assertEqual(line(fp), "cascade_sizes: False")
             self.assertEqual(line(fp), "cover_filename: coverimage.jpg")
+            self.assertEqual(line(fp), "crop_analysis_size:")
+            self.assertEqual(line(fp), "crop_backend: smartcrop.py")
+            self.assertEqual(line(fp), "dim_ladder: []")
             self.assertEqual(line(fp), "dim_max_cover: 600x600")
             self.assertEqual(line(fp), "dim_max_large: 1600")
             self.assertEqual(line(fp), "dim_max_small: 800")
             self.assertEqual(line(fp), "dim_max_thumb: 256x256")
+            self.assertEqual(line(fp), "dirname_ladder: srcset")
             self.assertEqual(line(fp), "dirname_large: large")
             self.assertEqual(line(fp), "dirname_small: small")
             self.assertEqual(line(fp), "dirname_thumb: thumb")
+            self.assertEqual(line(fp), "extra_formats: []")
+            self.assertEqual(line(fp), "jpeg_draft: False")
             self.assertEqual(line(fp), "jpeg_optimize: False")
             self.assertEqual(line(fp), "jpeg_progressive: False")
             self.assertEqual(line(fp), "jpeg_quality: 75")
@@ -41,6 +50,7 @@ class ConfigTestCase(unittest.TestCase):
             self.assertEqual(line(fp), "output_dir:")
             self.assertEqual(line(fp), "output_format: jpg")
             self.assertEqual(line(fp), "photo_dir: photos")
+            self.assertEqual(line(fp), "placeholder:")
             self.assertEqual(line(fp), "smartcrop_js_path:")
             self.assertEqual(line(fp), "url_prefix:")
             self.assertEqual(line(fp), "use_smartcrop_js: False")
@@ -61,14 +71,22 @@ class ConfigTestCase(unittest.TestCase):
         with open(self._tempfile, "r") as fp:
             self.assertEqual(line(fp), "---")
             self.assertEqual(line(fp), "album_file: album.yml")
+            self.assertEqual(line(fp), "cache_file: .hps_cache.json")
+            self.assertEqual(line(fp), "cascade_sizes: False")
             self.assertEqual(line(fp), "cover_filename: coverimage.jpg")
+            self.assertEqual(line(fp), "crop_analysis_size:")
+            self.assertEqual(line(fp), "crop_backend: smartcrop.py")
+            self.assertEqual(line(fp), "dim_ladder: []")
             self.assertEqual(line(fp), "dim_max_cover: 600x600")
             self.assertEqual(line(fp), "dim_max_large: 1600")
             self.assertEqual(line(fp), "dim_max_small: 500")
             self.assertEqual(line(fp), "dim_max_thumb: 256x256")
+            self.assertEqual(line(fp), "dirname_ladder: srcset")
             self.assertEqual(line(fp), "dirname_large: large")
             self.assertEqual(line(fp), "dirname_small: small")
             self.assertEqual(line(fp), "dirname_thumb: thumb")
+            self.assertEqual(line(fp), "extra_formats: []")
+            self.assertEqual(line(fp), "jpeg_draft: False")
             self.assertEqual(line(fp), "jpeg_optimize: False")
             self.assertEqual(line(fp), "jpeg_progressive: True")
             self.assertEqual(line(fp), "jpeg_quality: 75")
@@ -76,6 +94,7 @@ class ConfigTestCase(unittest.TestCase):
             self.assertEqual(line(fp), "output_dir:")
             self.assertEqual(line(fp), "output_format: jpg")
             self.assertEqual(line(fp), "photo_dir: photo_files")
+            self.assertEqual(line(fp), "placeholder:")
             self.assertEqual(line(fp), "smartcrop_js_path:")
             self.assertEqual(line(fp), "url_prefix:")
             self.assertEqual(line(fp), "use_smartcrop_js: False")
@@ -95,6 +114,49 @@ class ConfigTestCase(unittest.TestCase):
         )
         self.assertTrue(settings.validate())
 
+    def test_config_crop_backend(self):
+        paths = dict(
+            markdown_dir="/path/to/markdown", output_dir="/path/to/output"
+        )
+        for backend in ["smartcrop.py", "numpy"]:
+            settings = Settings(crop_backend=backend, **paths)
+            self.assertTrue(settings.validate())
+        settings = Settings(crop_backend="unknown", **paths)
+        self.assertFalse(settings.validate())
+
+        # both ways of choosing SmartCrop.js need its path
+        settings = Settings(crop_backend="smartcrop.js", **paths)
+        self.assertFalse(settings.validate())
+        settings = Settings(use_smartcrop_js=True, **paths)
+        self.assertFalse(settings.validate())
+        settings = Settings(
+            crop_backend="smartcrop.js",
+            smartcrop_js_path="/path/to/smartcrop.js",
+            **paths,
+        )
+        self.assertTrue(settings.validate())
+
+    def test_config_extra_formats(self):
+        paths = dict(
+            markdown_dir="/path/to/markdown", output_dir="/path/to/output"
+        )
+        settings = Settings(extra_formats=["webp", "PNG"], **paths)
+        self.assertTrue(settings.validate())
+        settings = Settings(extra_formats=["webp", "heic"], **paths)
+        self.assertFalse(settings.validate())
+        settings = Settings(extra_formats="avif", **paths)
+        self.assertEqual(settings.validate(), can_save("avif"))
+
+    def test_config_placeholder(self):
+        paths = dict(
+            markdown_dir="/path/to/markdown", output_dir="/path/to/output"
+        )
+        for placeholder in [None, "blurhash", "preview"]:
+            settings = Settings(placeholder=placeholder, **paths)
+            self.assertTrue(settings.validate())
+        settings = Settings(placeholder="thumbhash", **paths)
+        self.assertFalse(settings.validate())
+
     def test_config_5(self):
         self.maxDiff = None
 
@@ -144,6 +206,15 @@ class ConfigTestCase(unittest.TestCase):
         self.assertEqual(settings.verbose, False)
         self.assertEqual(settings.fast, False)
 
+    def test_config_6(self):
+        settings = Settings(dim_ladder=[640, "320"])
+        self.assertEqual(settings.dim_ladder, [640, 320])
+        settings = Settings(dim_ladder="320/640, 1024")
+        self.assertEqual(settings.dim_ladder, [320, 640, 1024])
+        settings = Settings(dim_ladder=None, extra_formats="webp")
+        self.assertEqual(settings.dim_ladder, [])
+        self.assertEqual(settings.extra_formats, ["webp"])
+
 
 if __name__ == "__main__":
     unittest.main()
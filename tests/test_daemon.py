@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for the daemon
+
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from unittest import mock
+
+from hugophotoswipe.config import settings
+from hugophotoswipe.daemon import SOCKET_FILENAME
+from hugophotoswipe.daemon import request
+from hugophotoswipe.hugophotoswipe import HugoPhotoSwipe
+
+
+class DaemonTestCase(unittest.TestCase):
+    def setUp(self):
+        self._here = os.path.dirname(os.path.realpath(__file__))
+        self._tmpdir = tempfile.mkdtemp(prefix="hps_daemon_")
+        os.chdir(self._tmpdir)
+        settings.__init__(**dict())
+        setattr(settings, "output_dir", os.path.join(self._tmpdir, "output"))
+        setattr(settings, "markdown_dir", os.path.join(self._tmpdir, "md"))
+        settings.dump(".")
+
+        HugoPhotoSwipe(albums=[]).new(name="dogs")
+        data_dir = os.path.join(self._here, "data", "dogs")
+        for f in os.listdir(data_dir):
+            shutil.copy(os.path.join(data_dir, f), "dogs/photos")
+        self._proc = None
+
+    def tearDown(self):
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+        os.chdir(self._here)
+        shutil.rmtree(self._tmpdir)
+
+    def _start_daemon(self):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.path.dirname(self._here)
+        self._proc = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "from hugophotoswipe.config import load_settings; "
+                "from hugophotoswipe.daemon import Daemon; "
+                "load_settings(); Daemon().serve()",
+            ],
+            env=env,
+            stdout=subprocess.DEVNULL,
+        )
+        for _ in range(200):
+            if request("status", quiet=True) == 0:
+                return
+            time.sleep(0.05)
+        self.fail("The daemon didn't start.")
+
+    def _request(self, *args, **kwargs):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            code = request(*args, **kwargs)
+        return code, output.getvalue()
+
+    def test_no_daemon(self):
+        self.assertIsNone(request("status"))
+
+    def test_daemon(self):
+        self._start_daemon()
+        md_file = os.path.join(settings.markdown_dir, "dogs.md")
+
+        code, output = self._request("update", album="dogs/")
+        self.assertEqual(code, 0)
+        self.assertIn("Album dogs updated.", output)
+        self.assertTrue(os.path.exists(md_file))
+
+        code, output = self._request("status")
+        self.assertEqual(code, 0)
+        self.assertIn("Loaded albums: 1 (dogs)", output)
+
+        code, output = self._request("update", album="cats")
+        self.assertEqual(code, 1)
+        self.assertIn("Couldn't find album with name cats.", output)
+
+        # questions are asked by the client
+        with mock.patch("builtins.input", return_value="n") as ask:
+            code, _ = self._request("clean", album="dogs")
+        self.assertEqual(code, 0)
+        self.assertIn("Is this okay?", ask.call_args.args[0])
+        self.assertTrue(os.path.exists(md_file))
+        with mock.patch("builtins.input", return_value="y"):
+            code, _ = self._request("clean", album="dogs")
+        self.assertFalse(os.path.exists(md_file))
+
+        code, output = self._request("stop")
+        self.assertEqual(code, 0)
+        self.assertEqual(self._proc.wait(timeout=10), 0)
+        self.assertFalse(os.path.exists(SOCKET_FILENAME))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,6 +5,10 @@ import shutil
 import tempfile
 import unittest
 
+from unittest import mock
+
+from hugophotoswipe.album import Album
+from hugophotoswipe.config import settings
 from hugophotoswipe.hugophotoswipe import HugoPhotoSwipe
 
 
@@ -13,6 +17,9 @@ class HugoPhotoSwipeTestCase(unittest.TestCase):
         self._here = os.path.dirname(os.path.realpath(__file__))
         self._tmpdir = tempfile.mkdtemp(prefix="hps_test_")
         os.chdir(self._tmpdir)
+        settings.__init__(**dict())
+        setattr(settings, "output_dir", os.path.join(self._tmpdir, "output"))
+        setattr(settings, "markdown_dir", os.path.join(self._tmpdir, "md"))
 
     def tearDown(self):
         os.chdir(self._here)
@@ -43,6 +50,60 @@ class HugoPhotoSwipeTestCase(unittest.TestCase):
             self.assertEqual(fp.readline(), "photos:\n")
             self.assertEqual(fp.readline(), "hashes:")
 
+    def _make_album(self, name):
+        hps = HugoPhotoSwipe(albums=[])
+        hps.new(name=name)
+        data_dir = os.path.join(self._here, "data", name)
+        for f in os.listdir(data_dir):
+            shutil.copy(
+                os.path.join(data_dir, f), os.path.join(name, "photos")
+            )
+
+    def test_update_all(self):
+        self._make_album("cats")
+        self._make_album("dogs")
+        setattr(settings, "jobs", 2)
+
+        hps = HugoPhotoSwipe()
+        hps.update_all()
+
+        for name in ["cats", "dogs"]:
+            with self.subTest(album=name):
+                md_file = os.path.join(settings.markdown_dir, name + ".md")
+                self.assertTrue(os.path.exists(md_file))
+                with open(md_file, "r") as fp:
+                    self.assertEqual(fp.read().count("{{< photo "), 3)
+                for mode in ["large", "small", "thumb"]:
+                    out_dir = os.path.join(settings.output_dir, name, mode)
+                    self.assertEqual(len(os.listdir(out_dir)), 3)
+                with open(os.path.join(name, "album.yml"), "r") as fp:
+                    self.assertEqual(fp.read().count("sha256:"), 3)
+
+    def test_lazy_load(self):
+        self._make_album("cats")
+        self._make_album("dogs")
+        os.makedirs("not_an_album")
+
+        with mock.patch.object(
+            Album, "load", autospec=True, side_effect=Album.load
+        ) as load:
+            hps = HugoPhotoSwipe()
+            self.assertEqual(load.call_count, 0)
+
+            # only the album that is updated is loaded
+            hps.update_single("dogs/")
+            self.assertEqual(
+                [c.args[0] for c in load.call_args_list], ["dogs"]
+            )
+
+            # iterating loads every album
+            load.reset_mock()
+            self.assertEqual([a.name for a in hps.albums], ["cats", "dogs"])
+            self.assertEqual(load.call_count, 2)
+
+        with self.assertRaises(SystemExit):
+            hps.clean_single("not_an_album")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""
+Regression tests for the start-up time of the hps executable
+
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# Modules that commands that don't process photos shouldn't import
+HEAVY_MODULES = ["PIL", "numpy", "smartcrop", "tqdm", "yaml"]
+
+# Generous upper bound on the time to import HugoPhotoSwipe, in seconds. It
+# took about 0.2 seconds when the image libraries were imported at start-up.
+MAX_IMPORT_TIME = 0.15
+
+
+class ImportTimeTestCase(unittest.TestCase):
+    def setUp(self):
+        self._here = os.path.dirname(os.path.realpath(__file__))
+        self._tmpdir = tempfile.mkdtemp(prefix="hps_importtime_")
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpdir)
+
+    def _import_times(self, *args):
+        """Run hps with the given arguments and get the imported modules
+
+        Returns a dict with the cumulative import time in seconds of every
+        module that was imported, and the total time of the modules of
+        HugoPhotoSwipe that were imported directly.
+        """
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.path.dirname(self._here)
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-m", "hugophotoswipe"]
+            + list(args),
+            cwd=self._tmpdir,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        times = {}
+        total = 0
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:"):
+                continue
+            _, cumulative, name = line[len("import time:") :].split("|")
+            if not cumulative.strip().isdigit():
+                continue
+            seconds = int(cumulative) / 1e6
+            times[name.strip()] = seconds
+            # nested imports are indented and included in the cumulative time
+            if name.startswith(" hugophotoswipe"):
+                total += seconds
+        return times, total
+
+    def _check(self, times, total):
+        for module in HEAVY_MODULES:
+            with self.subTest(module=module):
+                self.assertNotIn(module, times)
+        self.assertLess(total, MAX_IMPORT_TIME)
+
+    def test_version(self):
+        self._check(*self._import_times("--version"))
+
+    def test_init(self):
+        self._check(*self._import_times("init"))
+        pth = os.path.join(self._tmpdir, "hugophotoswipe.yml")
+        self.assertTrue(os.path.exists(pth))
+
+
+if __name__ == "__main__":
+    unittest.main()
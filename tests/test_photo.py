@@ -3,15 +3,24 @@ Unit tests for the Photo class
 
 """
 
+import builtins
+import hashlib
 import os
 import shutil
 import tempfile
 import unittest
 
+from unittest import mock
+
 from PIL import Image
 
+from hugophotoswipe.config import can_save
 from hugophotoswipe.config import settings
 from hugophotoswipe.photo import Photo
+from hugophotoswipe.photo import analysis_proxy
+from hugophotoswipe.photo import crop_key
+from hugophotoswipe.saliency import NumpySaliencyMap
+from hugophotoswipe.saliency import SaliencyMap
 
 
 class PhotoTestCase(unittest.TestCase):
@@ -128,6 +137,101 @@ class PhotoTestCase(unittest.TestCase):
         )
         self.assertEqual(self.photo.shortcode, expected)
 
+        setattr(settings, "extra_formats", ["webp"])
+        expected = (
+            f'{{{{< photo href="{exp_large}" largeDim="1600x1066" '
+            f'smallUrl="{exp_small}" smallDim="800x533" alt="{exp_alt}" '
+            f'thumbSize="256x256" thumbUrl="{exp_thumb}" '
+            f'largeUrlWebp="{exp_large[:-4]}.webp" '
+            f'smallUrlWebp="{exp_small[:-4]}.webp" '
+            f'thumbUrlWebp="{exp_thumb[:-4]}.webp" '
+            f'caption="{exp_cap}" copyright="{exp_copy}" >}}}}'
+        )
+        self.assertEqual(self.photo.shortcode, expected)
+
+    def test_create_sizes_extra_formats(self):
+        output_dir = os.path.join(self._tmpdir, "output")
+        setattr(settings, "output_dir", output_dir)
+        # AVIF is only tested if the installed Pillow can save it
+        extra_formats = ["webp", "avif"] if can_save("avif") else ["webp"]
+        setattr(settings, "extra_formats", extra_formats)
+
+        self.photo.create_sizes()
+        for mode in ["large", "small", "thumb"]:
+            formats = {mode: "JPEG"}
+            for fmt in extra_formats:
+                formats[mode + "." + fmt] = fmt.upper()
+            paths = self.photo.rendition_paths(mode)
+            self.assertEqual(sorted(paths), sorted(formats))
+            for key, pth in paths.items():
+                with Image.open(pth) as img:
+                    self.assertEqual(img.format, formats[key])
+                    self.assertEqual(img.size, self.photo.resize_dims(mode))
+                self.assertIn(key, self.photo.renditions)
+        self.assertEqual(self.photo.stale_sizes(self.photo.sha256sum()), [])
+
+    def test_ladder_modes(self):
+        setattr(settings, "output_dir", self._tmpdir)
+        setattr(settings, "dim_ladder", [320, 1024, 640, 2400])
+        self.assertEqual(
+            self.photo.ladder_modes(),
+            ["ladder:1024", "ladder:640", "ladder:320"],
+        )
+        self.assertEqual(self.photo.resize_dims("ladder:640"), (640, 427))
+        self.assertEqual(
+            os.path.basename(self.photo.size_path("ladder:640")),
+            "dog_1_640x427.jpg",
+        )
+
+    def test_create_sizes_ladder(self):
+        output_dir = os.path.join(self._tmpdir, "output")
+        setattr(settings, "output_dir", output_dir)
+        setattr(settings, "dim_ladder", [320, 640, 1024])
+
+        # every step is resized from the previous one
+        sources = []
+        rescale = Photo._rescale
+
+        def record(photo, mode, source):
+            sources.append((mode, source.size))
+            return rescale(photo, mode, source)
+
+        with mock.patch.object(Photo, "_rescale", record):
+            self.photo.create_sizes(modes=["ladder:1024", "ladder:320"])
+        self.assertEqual(
+            sources,
+            [
+                ("ladder:1024", (2144, 1429)),
+                ("ladder:640", (1024, 683)),
+                ("ladder:320", (640, 427)),
+            ],
+        )
+        self.assertEqual(
+            sorted(self.photo.renditions), ["ladder:1024", "ladder:320"]
+        )
+        self.assertFalse(os.path.exists(self.photo.size_path("ladder:640")))
+        with Image.open(self.photo.size_path("ladder:320")) as img:
+            self.assertEqual(img.size, (320, 213))
+
+    def test_shortcode_ladder(self):
+        setattr(settings, "output_dir", self._tmpdir)
+        setattr(settings, "url_prefix", "/albums")
+        setattr(settings, "dim_ladder", [640, 320])
+        setattr(settings, "extra_formats", ["webp"])
+        prefix = "/albums/test_album/srcset/dog_1_"
+        self.assertIn(
+            f'srcset="{prefix}320x213.jpg 320w, {prefix}640x427.jpg 640w" '
+            f'srcsetWebp="{prefix}320x213.webp 320w, '
+            f'{prefix}640x427.webp 640w" ',
+            self.photo.shortcode,
+        )
+
+    def test_shortcode_ladder_wider(self):
+        setattr(settings, "output_dir", self._tmpdir)
+        setattr(settings, "dim_ladder", [4096, 3072])
+        setattr(settings, "extra_formats", ["webp"])
+        self.assertNotIn("srcset", self.photo.shortcode)
+
     def test_width(self):
         self.assertEqual(self.photo.width, 2144)
 
@@ -194,12 +298,243 @@ class PhotoTestCase(unittest.TestCase):
                 self.assertEqual(img.height, size[1])
                 img.close()
 
+    def _saliency_sizes(
+        self, func, *args, saliency_class=SaliencyMap, **kwargs
+    ):
+        """Call func and return the sizes of the saliency maps"""
+        sizes = []
+        init = saliency_class.__init__
+
+        def record(saliency, *args, **kwargs):
+            init(saliency, *args, **kwargs)
+            sizes.append(saliency.size)
+
+        with mock.patch.object(saliency_class, "__init__", record):
+            func(*args, **kwargs)
+        return sizes
+
+    def test_thumb_analysis_size(self):
+        setattr(settings, "dim_max_thumb", "128x128")
+        setattr(settings, "crop_analysis_size", 512)
+        pth = os.path.join(self._tmpdir, "thumbnail.jpg")
+        with mock.patch(
+            "hugophotoswipe.photo.analysis_proxy", side_effect=analysis_proxy
+        ) as proxy:
+            sizes = self._saliency_sizes(
+                self.photo.create_thumb, mode="thumb", pth=pth
+            )
+        self.assertEqual(proxy.call_args.args[1], 512)
+        self.assertEqual(sizes, [(213, 142)])
+        with Image.open(pth) as img:
+            self.assertEqual(img.size, (128, 128))
+
+    def test_cover_saliency(self):
+        output_dir = os.path.join(self._tmpdir, "output")
+        setattr(settings, "output_dir", output_dir)
+        self.photo.cover_path = os.path.join(self._tmpdir, "cover.jpg")
+
+        # the thumbnail is analysed at its own resolution, and the square
+        # cover reuses its crop
+        sizes = self._saliency_sizes(
+            self.photo.create_sizes, modes=["thumb", "cover"]
+        )
+        self.assertEqual(sizes, [(426, 284)])
+        for pth, size in [
+            (self.photo.thumb_path, (256, 256)),
+            (self.photo.cover_path, (600, 600)),
+        ]:
+            with Image.open(pth) as img:
+                self.assertEqual(img.size, size)
+
+    def test_shared_saliency(self):
+        output_dir = os.path.join(self._tmpdir, "output")
+        setattr(settings, "output_dir", output_dir)
+        setattr(settings, "dim_max_cover", "384x256")
+        self.photo.cover_path = os.path.join(self._tmpdir, "cover.jpg")
+
+        # a cover with another aspect ratio that needs the same resolution
+        # shares the analysis of the thumbnail
+        sizes = self._saliency_sizes(
+            self.photo.create_sizes, modes=["thumb", "cover"]
+        )
+        self.assertEqual(sizes, [(426, 284)])
+        for pth, size in [
+            (self.photo.thumb_path, (256, 256)),
+            (self.photo.cover_path, (384, 256)),
+        ]:
+            with Image.open(pth) as img:
+                self.assertEqual(img.size, size)
+
+    def test_numpy_saliency(self):
+        output_dir = os.path.join(self._tmpdir, "output")
+        setattr(settings, "output_dir", output_dir)
+        setattr(settings, "crop_backend", "numpy")
+        setattr(settings, "dim_max_cover", "600x400")
+        self.photo.cover_path = os.path.join(self._tmpdir, "cover.jpg")
+
+        # every crop is analysed at the resolution it needs
+        sizes = self._saliency_sizes(
+            self.photo.create_sizes,
+            modes=["thumb", "cover"],
+            saliency_class=NumpySaliencyMap,
+        )
+        self.assertEqual(sizes, [(426, 284), (666, 444)])
+        for pth, size in [
+            (self.photo.thumb_path, (256, 256)),
+            (self.photo.cover_path, (600, 400)),
+        ]:
+            with Image.open(pth) as img:
+                self.assertEqual(img.size, size)
+
+    def test_crop_key(self):
+        self.assertEqual(
+            crop_key("abc", 256, 256, "smartcrop.py"), "abc:1:1:smartcrop.py"
+        )
+        self.assertEqual(
+            crop_key("abc", 600, 400, "smartcrop.js"), "abc:3:2:smartcrop.js"
+        )
+
+    def test_thumb_stored_crop(self):
+        setattr(settings, "dim_max_thumb", "128x128")
+        key = crop_key(self.photo.sha256sum(), 128, 128, "smartcrop.py")
+        self.photo.crops[key] = [100, 200, 1100, 1200]
+        pth = os.path.join(self._tmpdir, "thumbnail.jpg")
+        self.assertEqual(
+            self._saliency_sizes(
+                self.photo.create_thumb, mode="thumb", pth=pth
+            ),
+            [],
+        )
+        with Image.open(pth) as img:
+            self.assertEqual(img.size, (128, 128))
+
+    def test_analysis_proxy(self):
+        img = Image.new("RGB", (2144, 1429))
+        self.assertEqual(analysis_proxy(img, 512).size, (512, 341))
+        self.assertEqual(analysis_proxy(img, 4000).size, (2144, 1429))
+
+    def test_create_sizes_cascade(self):
+        output_dir = os.path.join(self._tmpdir, "output")
+        setattr(settings, "output_dir", output_dir)
+        setattr(settings, "cascade_sizes", True)
+        self.photo.cover_path = os.path.join(self._tmpdir, "cover.jpg")
+
+        self.photo.create_sizes()
+        expected = [
+            (self.photo.large_path, (1600, 1066)),
+            (self.photo.small_path, (800, 533)),
+            (self.photo.thumb_path, (256, 256)),
+            (self.photo.cover_path, (600, 600)),
+        ]
+        for pth, size in expected:
+            with self.subTest(path=pth):
+                img = Image.open(pth)
+                self.assertEqual(img.size, size)
+                img.close()
+
+    def test_cascade_source(self):
+        setattr(settings, "cascade_sizes", True)
+        original = self.photo.original_image
+        large = original.resize((1600, 1066))
+        small = original.resize((800, 533))
+        sources = [large, original]
+        self.assertIs(self.photo._cascade_source("small", sources), large)
+
+        sources = [small, large, original]
+        self.assertIs(self.photo._cascade_source("thumb", sources), small)
+        # small is too small for the 600x600 cover, large isn't
+        self.assertIs(self.photo._cascade_source("cover", sources), large)
+
+        setattr(settings, "cascade_sizes", False)
+        self.assertIs(self.photo._cascade_source("thumb", sources), original)
+
+    def test_jpeg_draft(self):
+        output_dir = os.path.join(self._tmpdir, "output")
+        setattr(settings, "output_dir", output_dir)
+        setattr(settings, "jpeg_draft", True)
+        setattr(settings, "dim_max_large", "500")
+        setattr(settings, "dim_max_small", "250")
+        setattr(settings, "dim_max_thumb", "100x100")
+
+        # 2144x1429 can be reduced by 4 and still cover 500x333
+        self.assertEqual(self.photo.original_image.size, (536, 358))
+        self.assertEqual(self.photo.width, 2144)
+        self.assertEqual(self.photo.height, 1429)
+
+        self.photo.create_sizes()
+        expected = [
+            (self.photo.large_path, (500, 333)),
+            (self.photo.small_path, (250, 167)),
+            (self.photo.thumb_path, (100, 100)),
+        ]
+        for pth, size in expected:
+            with self.subTest(path=pth):
+                img = Image.open(pth)
+                self.assertEqual(img.size, size)
+                img.close()
+
+    def test_jpeg_draft_dimensions(self):
+        output_dir = os.path.join(self._tmpdir, "output")
+        setattr(settings, "output_dir", output_dir)
+        setattr(settings, "jpeg_draft", True)
+        setattr(settings, "dim_max_large", "500")
+        setattr(settings, "dim_max_small", "250")
+
+        # the dimensions are those of the original, also when they are
+        # needed before the image is loaded
+        self.assertEqual(self.photo.width, 2144)
+        self.assertEqual(self.photo.height, 1429)
+        self.assertEqual(self.photo.original_image.size, (536, 358))
+        self.assertEqual(self.photo.resize_dims("large"), (500, 333))
+        self.assertTrue(self.photo.large_path.endswith("_500x333.jpg"))
+
+        # and when they are forgotten after the image is loaded
+        self.photo.forget_dimensions()
+        self.assertEqual(self.photo.width, 2144)
+        self.assertEqual(self.photo.height, 1429)
+
+    def test_jpeg_draft_large(self):
+        setattr(settings, "jpeg_draft", True)
+        # the large size needs the full image
+        self.assertEqual(self.photo.original_image.size, (2144, 1429))
+
+    def test_single_read(self):
+        output_dir = os.path.join(self._tmpdir, "output")
+        setattr(settings, "output_dir", output_dir)
+
+        real_open = builtins.open
+        with mock.patch("builtins.open", side_effect=real_open) as mock_open:
+            self.photo.sha256sum()
+            self.photo.create_sizes()
+        opened = [c.args[0] for c in mock_open.call_args_list]
+        self.assertEqual(opened.count(self.photo.original_path), 1)
+        self.photo.free()
+
     def test_sha256sum(self):
         self.assertEqual(
             self.photo.sha256sum(),
             "c2fdf14c548a08032fd06e6036197fc7e9c262e6d06fac40e54ec5dd2ce6912f",
         )
 
+    def test_sha256sum_replaced(self):
+        here = os.path.dirname(os.path.realpath(__file__))
+        pth = os.path.join(self._tmpdir, "dog.jpg")
+        shutil.copy(self.photo.original_path, pth)
+        photo = Photo(album_name="test_album", original_path=pth, name="dog")
+        photo.sha256sum()
+        photo.original_image
+
+        # the replaced file is mapped again and the old image is closed
+        new = os.path.join(self._tmpdir, "new.jpg")
+        shutil.copy(os.path.join(here, "data", "dogs", "dog-2.jpg"), new)
+        os.replace(new, pth)
+        with open(pth, "rb") as fp:
+            data = fp.read()
+        self.assertEqual(photo.sha256sum(), hashlib.sha256(data).hexdigest())
+        self.assertIsNone(photo._original_img)
+        self.assertEqual(photo._original_data[:], data)
+        photo.free()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,48 @@
+"""
+Unit tests for the placeholders
+
+"""
+
+import base64
+import io
+import os
+import unittest
+
+from PIL import Image
+
+from hugophotoswipe.placeholder import blurhash
+from hugophotoswipe.placeholder import dominant_color
+from hugophotoswipe.placeholder import preview
+
+
+class PlaceholderTestCase(unittest.TestCase):
+    def setUp(self):
+        here = os.path.dirname(os.path.realpath(__file__))
+        self._photo = os.path.join(here, "data", "dogs", "dog-1.jpg")
+
+    def test_blurhash(self):
+        # the values of the reference implementation
+        img = Image.new("RGB", (64, 48), (255, 0, 0))
+        self.assertEqual(blurhash(img, components=(1, 1)), "00TI:j")
+
+        with Image.open(self._photo) as img:
+            self.assertEqual(blurhash(img), "LKKws_~9.6_19VIX-ot9ExI:M#xH")
+
+    def test_dominant_color(self):
+        img = Image.new("RGB", (64, 48), (255, 0, 0))
+        img.paste((0, 0, 255), (0, 0, 20, 48))
+        self.assertEqual(dominant_color(img), "#ff0000")
+
+    def test_preview(self):
+        with Image.open(self._photo) as img:
+            uri = preview(img)
+        prefix = "data:image/webp;base64,"
+        self.assertTrue(uri.startswith(prefix))
+        data = base64.b64decode(uri[len(prefix) :])
+        with Image.open(io.BytesIO(data)) as small:
+            self.assertEqual(small.format, "WEBP")
+            self.assertEqual(max(small.size), 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
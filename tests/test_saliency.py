@@ -0,0 +1,120 @@
+"""
+Unit tests for the saliency maps
+
+"""
+
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+import smartcrop
+
+from PIL import Image
+
+from hugophotoswipe.config import settings
+from hugophotoswipe.photo import Photo
+from hugophotoswipe.saliency import MIN_SCALE
+from hugophotoswipe.saliency import NumpySaliencyMap
+from hugophotoswipe.saliency import SaliencyMap
+from hugophotoswipe.saliency import analysis_scale
+from hugophotoswipe.utils import scale_box
+
+
+def overlap(a, b):
+    """Intersection over union of two boxes"""
+    width = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    height = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    intersection = width * height
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return intersection / (area_a + area_b - intersection)
+
+
+class SaliencyTestCase(unittest.TestCase):
+    def setUp(self):
+        settings.__init__(**dict())
+        here = os.path.dirname(os.path.realpath(__file__))
+        self._photos = sorted(glob.glob(os.path.join(here, "data", "*", "*")))
+        self._tmpdir = tempfile.mkdtemp(prefix="hps_saliency_")
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpdir)
+
+    def _smartcrop(self, img, width, height):
+        crop = smartcrop.SmartCrop().crop(img, width, height)["top_crop"]
+        return (
+            crop["x"],
+            crop["y"],
+            crop["x"] + crop["width"],
+            crop["y"] + crop["height"],
+        )
+
+    def _crop(self, saliency_class, img, targets):
+        """Find crops for all targets with the maps of the saliency class"""
+        maps = {}
+        boxes = []
+        for width, height in targets:
+            scale = analysis_scale(img.size, width, height)
+            if scale not in maps:
+                maps[scale] = saliency_class.from_image(img, scale)
+            saliency = maps[scale]
+            # don't pick crops that would need upscaling, as in SmartCrop.py
+            fit = min(img.width / width, img.height / height)
+            min_scale = min(1.0, max(1 / fit, MIN_SCALE))
+            box = saliency.crop(width, height, min_scale=min_scale)
+            boxes.append(scale_box(box, saliency.size, img.size))
+        return boxes
+
+    def test_saliency_map(self):
+        # every crop is analysed at the scale of SmartCrop.py, also when the
+        # thumbnail and the cover are both cropped
+        targets = [(256, 256), (600, 600)]
+        for pth in self._photos:
+            with self.subTest(photo=os.path.basename(pth)):
+                with Image.open(pth) as img:
+                    img = img.convert("RGB")
+                boxes = self._crop(SaliencyMap, img, targets)
+                for box, (width, height) in zip(boxes, targets):
+                    expected = self._smartcrop(img, width, height)
+                    self.assertGreater(overlap(box, expected), 0.95)
+
+    def test_numpy_saliency_map(self):
+        thumbs, covers = [], []
+        for pth in self._photos:
+            with Image.open(pth) as img:
+                img = img.convert("RGB")
+            thumb, cover = self._crop(
+                NumpySaliencyMap, img, [(256, 256), (600, 600)]
+            )
+            thumbs.append(overlap(thumb, self._smartcrop(img, 256, 256)))
+            covers.append(overlap(cover, self._smartcrop(img, 600, 600)))
+
+        # every crop is analysed at the scale SmartCrop.py uses for it
+        self.assertGreater(min(thumbs), 0.93)
+        self.assertGreater(sum(thumbs) / len(thumbs), 0.96)
+        self.assertGreater(min(covers), 0.97)
+        self.assertGreater(sum(covers) / len(covers), 0.99)
+
+    def test_crop_backend(self):
+        here = os.path.dirname(os.path.realpath(__file__))
+        photo = Photo(
+            album_name="test_album",
+            original_path=os.path.join(here, "data", "dogs", "dog-1.jpg"),
+            name="dog_1",
+        )
+        pth = os.path.join(self._tmpdir, "thumbnail.jpg")
+        settings.crop_backend = "numpy"
+        photo.create_thumb(mode="thumb", pth=pth)
+        self.assertIsInstance(photo._saliency[2], NumpySaliencyMap)
+        with Image.open(pth) as img:
+            self.assertEqual(img.size, (256, 256))
+
+        settings.crop_backend = "unknown"
+        with self.assertRaises(ValueError):
+            photo.create_thumb(mode="thumb", pth=pth)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+Unit tests for the SmartCrop.js worker
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+
+from hugophotoswipe import smartcrop_js
+from hugophotoswipe.config import settings
+from hugophotoswipe.photo import Photo
+
+# Stand-in for the smartcrop node module that crops the rightmost square of
+# the image
+FAKE_SMARTCROP = """
+exports.crop = function (image, options) {
+  return options.imageOperations.open(image).then(function (img) {
+    return {
+      topCrop: {
+        x: img.width - img.height,
+        y: 0,
+        width: img.height,
+        height: img.height,
+      },
+    };
+  });
+};
+"""
+
+
+@unittest.skipIf(shutil.which("node") is None, "node is not available")
+class SmartCropJSTestCase(unittest.TestCase):
+    def setUp(self):
+        settings.__init__(**dict())
+        self._tmpdir = tempfile.mkdtemp(prefix="hps_smartcrop_js_")
+        module_dir = os.path.join(self._tmpdir, "node_modules", "smartcrop")
+        os.makedirs(module_dir)
+        with open(os.path.join(module_dir, "index.js"), "w") as fp:
+            fp.write(FAKE_SMARTCROP)
+        cli_path = os.path.join(self._tmpdir, "smartcrop-cli.js")
+        with open(cli_path, "w") as fp:
+            fp.write("")
+        settings.use_smartcrop_js = True
+        settings.smartcrop_js_path = cli_path
+
+    def tearDown(self):
+        smartcrop_js.close_worker()
+        shutil.rmtree(self._tmpdir)
+
+    def test_crop(self):
+        worker = smartcrop_js.get_worker()
+        img = Image.new("RGB", (1024, 512))
+        self.assertEqual(worker.crop(img, 100, 100), (512, 0, 1024, 512))
+        # the worker is reused for the next crop
+        self.assertIs(smartcrop_js.get_worker(), worker)
+        proc = worker._proc
+        img = Image.new("L", (100, 60))
+        self.assertEqual(worker.crop(img, 10, 10), (40, 0, 100, 60))
+        self.assertIs(worker._proc, proc)
+
+    def test_thumb(self):
+        here = os.path.dirname(os.path.realpath(__file__))
+        photo = Photo(
+            album_name="test_album",
+            original_path=os.path.join(here, "data", "dogs", "dog-1.jpg"),
+            name="dog_1",
+        )
+        settings.dim_max_thumb = "100x100"
+        pth = os.path.join(self._tmpdir, "thumb.jpg")
+        photo.create_thumb_js(mode="thumb", pth=pth)
+        with Image.open(pth) as img:
+            self.assertEqual(img.size, (100, 100))
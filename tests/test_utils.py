@@ -4,6 +4,13 @@ import os
 import tempfile
 import unittest
 
+import yaml
+
+from _constants import TEST_ALBUM_YAML_1
+from _constants import TEST_ALBUM_YAML_4
+
+from hugophotoswipe.utils import load_yaml
+from hugophotoswipe.utils import scale_box
 from hugophotoswipe.utils import yaml_field_to_file
 
 
@@ -40,6 +47,22 @@ class UtilsTestCase(unittest.TestCase):
         )
         self.assertEqual('  key: "123"\n', out)
 
+    def test_scale_box(self):
+        box = scale_box((10, 20, 110, 120), (200, 200), (400, 800))
+        self.assertEqual(box, (20, 80, 220, 480))
+        box = scale_box((0, 0, 201, 200), (200, 200), (400, 400))
+        self.assertEqual(box, (0, 0, 400, 400))
+
+    def test_load_yaml(self):
+        extra = (
+            "properties:\n  date: 2021-03-20\n  count: 3\n"
+            '  color: "#a9a7a5"\n  blurhash: "LKKws_~9.6_19VIX-ot9ExI:M#xH"\n'
+            "  empty:\n  flag: yes\n  ratio: 1.5\n  text: >\n    a b\n"
+        )
+        for text in [TEST_ALBUM_YAML_1, TEST_ALBUM_YAML_4, extra]:
+            with self.subTest(text=text[:20]):
+                self.assertEqual(load_yaml(text), yaml.safe_load(text))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+"""
+Unit tests for watching albums
+
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from unittest import mock
+
+from hugophotoswipe.album import Album
+from hugophotoswipe.config import settings
+from hugophotoswipe.hugophotoswipe import HugoPhotoSwipe
+from hugophotoswipe.photo import Photo
+from hugophotoswipe.watch import AlbumWatcher
+from hugophotoswipe.watch import InotifyMonitor
+from hugophotoswipe.watch import PollingMonitor
+
+
+class FakeMonitor(object):
+    """Monitor that returns prepared bursts of changes"""
+
+    def __init__(self, reads=None):
+        self.reads = [] if reads is None else reads
+        self.watched = []
+
+    def add(self, path):
+        if path in self.watched:
+            return False
+        self.watched.append(path)
+        return True
+
+    def read(self, timeout=None):
+        return self.reads.pop(0) if self.reads else []
+
+    def close(self):
+        pass
+
+
+class MonitorTestCase(object):
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp(prefix="hps_watch_")
+        self.monitor = self.make_monitor()
+
+    def tearDown(self):
+        self.monitor.close()
+        shutil.rmtree(self._tmpdir)
+
+    def _write(self, name, content):
+        with open(os.path.join(self._tmpdir, name), "w") as fp:
+            fp.write(content)
+
+    def _read_changes(self):
+        changed = set()
+        while True:
+            more = self.monitor.read(timeout=0.2)
+            if not more:
+                return changed
+            changed.update(os.path.basename(p) for p in more)
+
+    def test_changes(self):
+        self._write("a.jpg", "a")
+        self.assertTrue(self.monitor.add(self._tmpdir))
+        self.assertFalse(self.monitor.add(self._tmpdir))
+        self.assertEqual(self._read_changes(), set())
+
+        # the changes are not always seen in a single read
+        time.sleep(0.01)
+        self._write("a.jpg", "aa")
+        self._write("b.jpg", "b")
+        self.assertEqual(self._read_changes(), {"a.jpg", "b.jpg"})
+
+        os.unlink(os.path.join(self._tmpdir, "a.jpg"))
+        os.makedirs(os.path.join(self._tmpdir, "photos"))
+        self.assertEqual(self._read_changes(), {"a.jpg", "photos"})
+
+
+class PollingMonitorTestCase(MonitorTestCase, unittest.TestCase):
+    def make_monitor(self):
+        return PollingMonitor(interval=0.05)
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "requires Linux")
+class InotifyMonitorTestCase(MonitorTestCase, unittest.TestCase):
+    def make_monitor(self):
+        return InotifyMonitor()
+
+
+class AlbumWatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self._here = os.path.dirname(os.path.realpath(__file__))
+        self._tmpdir = tempfile.mkdtemp(prefix="hps_watch_")
+        os.chdir(self._tmpdir)
+        settings.__init__(**dict())
+        setattr(settings, "output_dir", os.path.join(self._tmpdir, "output"))
+        setattr(settings, "markdown_dir", os.path.join(self._tmpdir, "md"))
+
+        HugoPhotoSwipe(albums=[]).new(name="dogs")
+        self._data_dir = os.path.join(self._here, "data", "dogs")
+        self._add_photo("dog-1.jpg")
+        self._add_photo("dog-2.jpg")
+
+    def tearDown(self):
+        os.chdir(self._here)
+        shutil.rmtree(self._tmpdir)
+
+    def _add_photo(self, filename):
+        shutil.copy(
+            os.path.join(self._data_dir, filename),
+            os.path.join("dogs", "photos", filename),
+        )
+
+    def _process(self, watcher, paths):
+        """Process changes and return the photos whose sizes were created"""
+        with mock.patch.object(
+            Photo,
+            "create_sizes",
+            autospec=True,
+            side_effect=Photo.create_sizes,
+        ) as create_sizes:
+            watcher.process(paths)
+        return sorted(c.args[0].filename for c in create_sizes.call_args_list)
+
+    def test_watch(self):
+        watcher = AlbumWatcher(HugoPhotoSwipe(), FakeMonitor())
+        watcher.start()
+        self.assertEqual(
+            watcher.monitor.watched,
+            [".", "dogs", os.path.join("dogs", "photos")],
+        )
+        md_file = os.path.join(settings.markdown_dir, "dogs.md")
+        with open(md_file, "r") as fp:
+            self.assertEqual(fp.read().count("{{< photo "), 2)
+
+        # only the new photo is processed, the album is written once
+        self._add_photo("dog-3.jpg")
+        with mock.patch.object(
+            Album, "dump", autospec=True, side_effect=Album.dump
+        ) as dump:
+            processed = self._process(
+                watcher, ["dogs/photos/dog-3.jpg", "./dogs/photos/dog-3.jpg"]
+            )
+        self.assertEqual(processed, ["dog-3.jpg"])
+        self.assertEqual(dump.call_count, 1)
+        with open(md_file, "r") as fp:
+            self.assertEqual(fp.read().count("{{< photo "), 3)
+
+        # writes of the album file by the watcher itself are ignored
+        with mock.patch.object(Album, "update") as update:
+            watcher.process(["dogs/album.yml", "dogs/.hps_cache.json"])
+        self.assertEqual(update.call_count, 0)
+
+        # but other changes of the album file are not
+        with open(os.path.join("dogs", "album.yml"), "a") as fp:
+            fp.write("\n")
+        with mock.patch.object(Album, "update") as update:
+            watcher.process(["dogs/album.yml"])
+        self.assertEqual(update.call_count, 1)
+
+        # removed photos are removed from the album
+        os.unlink(os.path.join("dogs", "photos", "dog-1.jpg"))
+        self.assertEqual(self._process(watcher, ["dogs/photos/dog-1.jpg"]), [])
+        with open(md_file, "r") as fp:
+            self.assertEqual(fp.read().count("{{< photo "), 2)
+
+    def test_new_album(self):
+        watcher = AlbumWatcher(HugoPhotoSwipe(), FakeMonitor())
+        watcher.start()
+
+        # a new album is watched and processed completely
+        HugoPhotoSwipe(albums=[]).new(name="cats")
+        cats_dir = os.path.join(self._here, "data", "cats")
+        for f in os.listdir(cats_dir):
+            shutil.copy(os.path.join(cats_dir, f), "cats/photos")
+        self.assertEqual(len(self._process(watcher, ["./cats"])), 3)
+        self.assertIn(os.path.join("cats", "photos"), watcher.monitor.watched)
+
+    def test_wait(self):
+        monitor = FakeMonitor(reads=[["a"], ["b", "a"], [], ["c"]])
+        watcher = AlbumWatcher(HugoPhotoSwipe(albums=[]), monitor)
+        self.assertEqual(watcher.wait(), {"a", "b"})
+        self.assertEqual(watcher.wait(), {"c"})
+
+
+if __name__ == "__main__":
+    unittest.main()